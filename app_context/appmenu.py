@@ -1,4 +1,4 @@
-from importlib.metadata import entry_points
+from flask_app.services.extension import discover_extensions, extensions_generation
 
 
 class ApplicationMenu:
@@ -29,6 +29,22 @@ class ApplicationMenu:
         })
 
 
+_app_menu: tuple[int, ApplicationMenu] | None = None
+
+
+def get_app_menu() -> ApplicationMenu:
+    """
+    The menu is composed once, then again only after the extensions get reloaded.
+    """
+    global _app_menu
+
+    generation = extensions_generation()
+    if _app_menu is None or _app_menu[0] != generation:
+        _app_menu = (generation, compose_menu())
+
+    return _app_menu[1]
+
+
 def compose_menu() -> ApplicationMenu:
     menu = ApplicationMenu()
     menu.add_section("vod_chat", "VOD Chat", target_url="/vod-chat/")
@@ -39,12 +55,11 @@ def compose_menu() -> ApplicationMenu:
 
 
 def _load_menu_extensions(menu: ApplicationMenu) -> None:
-    discovered_extensions = entry_points(group="chat_analyzer.v1.blueprints", name="inject_menu")
+    discovered_extensions = discover_extensions("chat_analyzer.v1.blueprints", "inject_menu")
 
-    for extension in sorted(discovered_extensions):
+    for module, inject_menu in discovered_extensions:
         try:
-            inject_menu = extension.load()
             inject_menu(menu)
         except Exception:
-            print(f"Failed to update main manu by '{extension.module}' extension", flush=True)
+            print(f"Failed to update main manu by '{module}' extension", flush=True)
             raise
@@ -0,0 +1,59 @@
+"""
+Measure the emotes matching throughput in messages per second.
+
+    python -m benchmarks.mine_emoticons --hours 2 --rate 30 --custom 500
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic import CUSTOM_EMOTICONS, generate_chat
+from flask_app.services.lib import EmoticonsMatcher
+
+
+def generate_messages(hours: float, rate: float) -> list[tuple[str, list]]:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, "chat.jsonl")
+        generate_chat(file_path, hours, rate=rate)
+
+        with open(file_path, "r", encoding="utf-8") as fp:
+            return [(message["message"], message["emotes"]) for message in map(json.loads, fp)]
+
+
+def mine_emoticons_naive(message: str, platform_emotes: list[dict], custom_emoticons: set[str]) -> set[str]:
+    # The former implementation, it rebuilt a list of all the emotes for every message
+    emoticons = list(map(lambda x: x["name"], platform_emotes)) + list(custom_emoticons)
+
+    return {word for word in message.split(" ") if word in emoticons}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, default=2)
+    parser.add_argument("--rate", type=float, default=30.0, help="Average messages per second")
+    parser.add_argument("--custom", type=int, default=300, help="Number of custom emoticons")
+    args = parser.parse_args()
+
+    # The emoticons of the synthetic chat, padded with the ones never used to reach the requested number
+    custom_emoticons = CUSTOM_EMOTICONS + [f"custom{i}" for i in range(len(CUSTOM_EMOTICONS), args.custom)]
+    messages = generate_messages(args.hours, args.rate)
+
+    started_at = time.perf_counter()
+    for message, emotes in messages:
+        mine_emoticons_naive(message, emotes, set(custom_emoticons))
+    naive_elapsed = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    matcher = EmoticonsMatcher(set(custom_emoticons))
+    for message, emotes in messages:
+        matcher.match(message, emotes)
+    matcher_elapsed = time.perf_counter() - started_at
+
+    print(f"naive:   {len(messages) / naive_elapsed:12,.0f} messages/s")
+    print(f"matcher: {len(messages) / matcher_elapsed:12,.0f} messages/s  x{naive_elapsed / matcher_elapsed:.1f}")
+
+
+if __name__ == "__main__":
+    main()
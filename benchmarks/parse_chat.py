@@ -0,0 +1,56 @@
+"""
+Measure the chat parsing throughput by the number of worker processes.
+
+    python -m benchmarks.parse_chat --hours 24 --rate 30
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic import CUSTOM_EMOTICONS, generate_chat
+from flask_app.services import ingestion
+from flask_app.services.ingestion import ChatStatsCollector
+
+
+def measure(file_path: str, workers: int) -> float:
+    started_at = time.perf_counter()
+
+    collector = ChatStatsCollector(set(CUSTOM_EMOTICONS))
+    collector.add_chat_file(file_path, 0, workers)
+    with open(os.devnull, "wb") as fp:
+        collector.write_histograms(fp)
+
+    return time.perf_counter() - started_at
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, default=8)
+    parser.add_argument("--rate", type=float, default=30.0, help="Average messages per second")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    # Shard even the smaller benchmark files
+    ingestion.MIN_SHARD_SIZE = 1024 * 1024
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, "chat.jsonl")
+        messages_count = generate_chat(file_path, args.hours, rate=args.rate)
+
+        size_mb = os.path.getsize(file_path) / 1024 / 1024
+        print(f"{messages_count} messages, {size_mb:.1f} MiB", flush=True)
+
+        baseline = None
+        workers = 1
+        while workers <= args.max_workers:
+            elapsed = measure(file_path, workers)
+            baseline = baseline or elapsed
+
+            print(f"workers={workers:<3} {elapsed:7.2f}s  {size_mb / elapsed:7.1f} MiB/s  x{baseline / elapsed:.2f}",
+                  flush=True)
+            workers *= 2
+
+
+if __name__ == "__main__":
+    main()
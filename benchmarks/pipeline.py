@@ -0,0 +1,259 @@
+"""
+Time every stage of the VOD chat pipeline on synthetic chats, then the end-to-end graph response of the app.
+
+    python -m benchmarks.pipeline --hours 1 8 24
+    python -m benchmarks.pipeline --hours 1 --compare benchmarks/results/pipeline-20240101T000000.json
+
+Every stage is timed first, then run once more under `tracemalloc` for its peak memory, as the tracing slows down the
+Python-heavy stages.  The results are written to a JSON file, the `--compare` one is a results file of a previous run.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+from benchmarks.synthetic import generate_chat
+
+STAGES = [
+    "collect",
+    "load",
+    "timeline",
+    "messages_series",
+    "emoticons_series",
+    "figure",
+    "serialize",
+    "graph_cold",
+    "graph_warm",
+]
+
+
+def run_pipeline(hours: float, rate: float, repeat: int, parse_workers: int | None) -> dict:
+    # The data files are resolved relatively to the working directory, the same way as the app does.
+    from flask_app import init_app
+    from flask_app.services.cache import get_figure_cache
+    from flask_app.services.extension import load_vod_chat_figure_extensions
+    from flask_app.services.ingestion import ChatStatsCollector
+    from flask_app.services.lib import (
+        aggregate_messages_series,
+        build_emoticons_series,
+        build_multiplot_figure,
+        count_emoticons_top,
+        find_minimal_start_timestamp,
+        get_custom_emoticons,
+        hash_to_chat_file,
+        load_emoticons_histograms,
+        load_emoticons_timestamps,
+        load_messages_histogram,
+        load_messages_timestamps,
+        serialize_figure,
+        url_to_hash,
+    )
+    from flask_app.services.utils import normalize_counts
+    from flask_app.tasks.vod_chat import DumpVodChatMeta, ProcessVodChat
+    from flask_app.views import vod_chat as views
+
+    url = f"https://www.twitch.tv/videos/benchmark{hours:g}h"
+    video_hash = url_to_hash(url)
+    state = {}
+
+    DumpVodChatMeta(url=url).run()
+
+    started_at = time.perf_counter()
+    messages_count = generate_chat(hash_to_chat_file(video_hash), hours, rate=rate)
+    generated_in = time.perf_counter() - started_at
+
+    def collect():
+        collector = ChatStatsCollector(get_custom_emoticons())
+        collector.add_chat_file(hash_to_chat_file(video_hash), 0, parse_workers)
+        ProcessVodChat.write_outputs(collector, ProcessVodChat(url=url).output())
+
+    def load():
+        state["messages"] = load_messages_timestamps(video_hash)
+        state["emoticons"] = load_emoticons_timestamps(video_hash)
+        state["messages_histogram"] = load_messages_histogram(video_hash)
+        state["emoticons_histograms"] = load_emoticons_histograms(video_hash, state["emoticons"])
+
+        extensions = load_vod_chat_figure_extensions(state["messages"], state["emoticons"], {"url": url})
+        state["start_timestamp"] = find_minimal_start_timestamp(state["messages"], extensions)
+
+    def timeline():
+        state["messages_axis"], state["messages_counts"] = normalize_counts(
+            state["messages_histogram"],
+            views.MESSAGES_TIME_STEP,
+            state["start_timestamp"],
+        )
+
+    def messages_series():
+        state["messages_series"] = aggregate_messages_series(
+            state["messages_counts"],
+            views.MESSAGES_TIME_STEP,
+            views.ROLLING_WINDOWS,
+        )
+
+    def emoticons_series():
+        count_emoticons_top(state["emoticons"], top_size=None, min_occurrences=views.EMOTICONS_MIN_OCCURRENCES)
+        state["emoticons_axis"], state["emoticons_series"] = build_emoticons_series(
+            {emote: [histogram] for emote, histogram in state["emoticons_histograms"].items()},
+            views.EMOTICONS_TIME_STEP,
+            forced_start_timestamp=state["start_timestamp"],
+            top_size=views.EMOTICONS_TOP_SIZE,
+            min_occurrences=views.EMOTICONS_MIN_OCCURRENCES,
+        )
+
+    def figure():
+        state["figure"] = build_multiplot_figure(
+            state["messages_axis"],
+            state["messages_series"],
+            state["emoticons_axis"],
+            state["emoticons_series"],
+            "Video time (in minutes)",
+            messages_points_budget=views.MESSAGES_POINTS_BUDGET,
+        )
+
+    def serialize():
+        serialize_figure(state["figure"])
+
+    client = init_app().test_client()
+
+    def request_graph():
+        response = client.get(f"/vod-chat/calc_vod_graph/{video_hash}")
+        if response.status_code != 200:
+            raise RuntimeError(f"The graph response failed with the {response.status_code} status")
+
+    def graph_cold():
+        get_figure_cache().invalidate(video_hash)
+        request_graph()
+
+    stage_functions = {
+        "collect": collect,
+        "load": load,
+        "timeline": timeline,
+        "messages_series": messages_series,
+        "emoticons_series": emoticons_series,
+        "figure": figure,
+        "serialize": serialize,
+        "graph_cold": graph_cold,
+        "graph_warm": request_graph,
+    }
+
+    stages = {"generate": {"seconds": generated_in}}
+    for name in STAGES:
+        stages[name] = measure(stage_functions[name], repeat)
+        print(f"  {name:<18} {stages[name]['seconds']:9.4f}s {stages[name]['peak_bytes'] / 2 ** 20:9.1f} MiB", flush=True)
+
+    return {
+        "hours": hours,
+        "messages": messages_count,
+        "chat_bytes": os.path.getsize(hash_to_chat_file(video_hash)),
+        "stages": stages,
+        "max_rss_bytes": get_max_rss(),
+    }
+
+
+def measure(fn: Callable[[], None], repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started_at)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"seconds": min(timings), "peak_bytes": peak_bytes}
+
+
+def get_max_rss() -> int | None:
+    if resource is None:
+        return None
+
+    # Kilobytes on Linux, bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def compare(results: dict, previous: dict) -> None:
+    previous_runs = {run["hours"]: run for run in previous["runs"]}
+
+    print(f"Compared to {previous['created_at']}:")
+    for run in results["runs"]:
+        previous_run = previous_runs.get(run["hours"])
+        if previous_run is None:
+            continue
+
+        print(f"{run['hours']:g}h:")
+        for name, stage in run["stages"].items():
+            previous_stage = previous_run["stages"].get(name)
+            if previous_stage is None:
+                continue
+
+            ratio = stage["seconds"] / previous_stage["seconds"] if previous_stage["seconds"] else float("nan")
+            print(f"  {name:<18} {previous_stage['seconds']:9.4f}s -> {stage['seconds']:9.4f}s  x{ratio:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, nargs="+", default=[1, 8, 24], help="Durations of the chats")
+    parser.add_argument("--rate", type=float, default=5.0, help="Average messages per second")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing runs of every stage, the best one is kept")
+    parser.add_argument("--parse-workers", type=int, default=0, help="Chat parsing processes, 0 uses all CPU cores")
+    parser.add_argument("--output", help="Results file, a timestamped one in benchmarks/results/ by default")
+    parser.add_argument("--compare", help="Results file of a previous run")
+    args = parser.parse_args()
+
+    created_at = datetime.now(timezone.utc)
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "results",
+        f"pipeline-{created_at:%Y%m%dT%H%M%S}.json",
+    )
+
+    results = {
+        "created_at": created_at.isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": vars(args),
+        "runs": [],
+    }
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        os.makedirs("data")
+        try:
+            for hours in args.hours:
+                print(f"{hours:g}h chat:", flush=True)
+                results["runs"].append(run_pipeline(hours, args.rate, args.repeat, args.parse_workers or None))
+        finally:
+            os.chdir(cwd)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as fp:
+        json.dump(results, fp, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as fp:
+            compare(results, json.load(fp))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Generate a synthetic chat: bursts of activity over a slowly drifting base rate, with Zipf-distributed emotes.
+
+    python -m benchmarks.synthetic chat.jsonl --hours 8 --rate 5
+"""
+import argparse
+import json
+import random
+
+import numpy as np
+
+START_TIMESTAMP = 1_700_000_000  # In seconds
+# A burst starts every 5 minutes on average, and spams a hype emote for up to a minute and a half
+BURST_INTERVAL = 300  # In seconds
+BURST_MAX_LENGTH = 90  # In seconds
+
+PLATFORM_EMOTES = [
+    {"id": f"emote{i}", "name": name}
+    for i, name in enumerate(
+        ["LUL", "Kappa", "PogChamp", "KEKW", "OMEGALUL", "monkaS", "Pog", "Sadge", "catJAM", "PepeHands"]
+        + [f"Emote{i}" for i in range(140)]
+    )
+]
+# Present in the text only, like the emotes of the third-party extensions
+CUSTOM_EMOTICONS = [f"custom{i}" for i in range(50)]
+WORDS = ["hello", "world", "lol", "gg", "what", "no", "way", "chat", "is", "this", "real", "wp", "nice", "clip", "it"]
+
+
+def generate_chat(file_path: str, hours: float, *, rate: float = 5.0, seed: int = 1) -> int:
+    """
+    Write a JSONL chat of the given duration and the average messages `rate` per second, return the messages count.
+    """
+    rng = np.random.default_rng(seed)
+    rnd = random.Random(seed)
+
+    seconds = int(hours * 3600)
+    timeline = np.arange(seconds)
+
+    # The audience grows during the first 10 minutes, then drifts slowly over the stream
+    base_rate = rate * np.minimum(timeline / 600 + .1, 1) * (1 + .4 * np.sin(2 * np.pi * timeline / 7200 + rng.uniform(0, 6)))
+
+    burst_rate = np.zeros(seconds)
+    hype_emotes = np.full(seconds, -1)
+    for start in np.flatnonzero(rng.random(seconds) < 1 / BURST_INTERVAL):
+        length = int(rng.integers(10, BURST_MAX_LENGTH))
+        amplitude = rate * rng.lognormal(1.5, .5)
+
+        decay = amplitude * np.exp(-np.arange(length) / (length / 3))[:seconds - start]
+        burst_rate[start:start + length] += decay
+        hype_emotes[start:start + length] = rng.integers(0, 10)
+
+    counts = rng.poisson(base_rate + burst_rate)
+
+    emotes = [(e["name"], e) for e in PLATFORM_EMOTES] + [(name, None) for name in CUSTOM_EMOTICONS]
+    emote_weights = np.cumsum(1 / np.arange(1, len(emotes) + 1) ** 1.1).tolist()
+
+    with open(file_path, "w", encoding="utf-8") as fp:
+        for second in np.flatnonzero(counts):
+            burst_share = burst_rate[second] / (base_rate[second] + burst_rate[second])
+
+            for microseconds in sorted(rnd.randrange(1_000_000) for _ in range(counts[second])):
+                if hype_emotes[second] >= 0 and rnd.random() < burst_share:
+                    hype = PLATFORM_EMOTES[hype_emotes[second]]
+                    words = [hype["name"]] * rnd.randint(1, 4)
+                    message_emotes = [hype]
+                else:
+                    words = rnd.choices(WORDS, k=rnd.randint(1, 8))
+                    message_emotes = []
+
+                    if rnd.random() < .35:
+                        name, emote = rnd.choices(emotes, cum_weights=emote_weights)[0]
+                        words.insert(rnd.randint(0, len(words)), name)
+                        if emote is not None:
+                            message_emotes.append(emote)
+
+                fp.write(json.dumps({
+                    "timestamp": (START_TIMESTAMP + int(second)) * 1_000_000 + microseconds,
+                    "time_in_seconds": int(second) + microseconds / 1_000_000,
+                    "message": " ".join(words),
+                    "emotes": message_emotes,
+                    "author": {"name": f"user{int(rnd.paretovariate(1.2)) % 50_000}"},
+                }) + "\n")
+
+    return int(counts.sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file_path")
+    parser.add_argument("--hours", type=float, default=1)
+    parser.add_argument("--rate", type=float, default=5.0, help="Average messages per second")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    messages_count = generate_chat(args.file_path, args.hours, rate=args.rate, seed=args.seed)
+    print(f"{messages_count} messages written to {args.file_path}")
+
+
+if __name__ == "__main__":
+    main()
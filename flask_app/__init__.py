@@ -1,7 +1,6 @@
-from importlib.metadata import entry_points
 from os import getenv
 
-from flask import Blueprint, Flask, redirect, url_for
+from flask import Blueprint, Flask, current_app, redirect, url_for
 
 
 def init_app():
@@ -13,8 +12,23 @@ def init_app():
     from flask_app.views.vod_chat import vod_chat_bp
     app.register_blueprint(vod_chat_bp, url_prefix="/vod-chat")
 
+    from flask_app.services.metrics import get_stage_metrics
+    get_stage_metrics().init_app(app)
+
     _load_blueprint_extensions(app)
 
+    @app.route("/reload-extensions", methods=["POST"])
+    def reload_extensions_view():
+        # Lets the development server pick up the installed or removed extensions without a restart.  The debug mode
+        # is checked per request, because `app.run(debug=True)` enables it only after the app is created.
+        if not current_app.debug:
+            return {"success": False}, 404
+
+        from flask_app.services.extension import reload_extensions
+        reload_extensions()
+
+        return {"success": True}
+
     @app.route("/")
     def index():
         # TODO Make this redirect configurable on the application level.
@@ -24,18 +38,18 @@ def init_app():
 
 
 def _load_blueprint_extensions(app: Flask) -> None:
-    discovered_extensions = entry_points(group="chat_analyzer.v1.blueprints", name="inject_blueprint")
+    from flask_app.services.extension import discover_extensions
+    discovered_extensions = discover_extensions("chat_analyzer.v1.blueprints", "inject_blueprint")
 
-    for extension in sorted(discovered_extensions):
+    for module, inject_blueprint in discovered_extensions:
         try:
-            inject_blueprint = extension.load()
             bp: Blueprint = inject_blueprint(app)
 
             if bp:
                 print(
-                    f"Successfully loaded blueprint '{bp.name}' ({bp.import_name}) from '{extension.module}' extension",
+                    f"Successfully loaded blueprint '{bp.name}' ({bp.import_name}) from '{module}' extension",
                     flush=True,
                 )
         except Exception:
-            print(f"Failed to load a blueprint from '{extension.module}' extension", flush=True)
+            print(f"Failed to load a blueprint from '{module}' extension", flush=True)
             raise
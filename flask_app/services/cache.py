@@ -0,0 +1,165 @@
+import glob
+import json
+import os
+import threading
+from collections import OrderedDict
+from hashlib import sha256
+from os import getenv
+
+COMBINED_LABEL = "combined"
+
+
+class FigureCache:
+    """
+    Size-bounded LRU cache of rendered graph payloads with an optional on-disk tier.
+
+    Every entry is labelled by the video hash it was rendered for (or by the "combined" label), so all entries of
+    a video can be dropped when its chat gets updated.
+    """
+
+    def __init__(self, max_bytes: int, disk_dir: str | None = None, max_disk_bytes: int = 0):
+        self._max_bytes: int = max_bytes
+        self._disk_dir: str | None = disk_dir if disk_dir and max_disk_bytes > 0 else None
+        self._max_disk_bytes: int = max_disk_bytes
+
+        self._entries: OrderedDict[str, tuple[str, bytes]] = OrderedDict()
+        self._total_bytes: int = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "FigureCache":
+        return cls(
+            max_bytes=int(getenv("FIGURE_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+            disk_dir="data/figure-cache",
+            max_disk_bytes=int(getenv("FIGURE_CACHE_DISK_MAX_BYTES", 0)),
+        )
+
+    def get(self, label: str, key: str) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        payload = self._read_disk(label, key)
+        if payload is not None:
+            self._put_memory(label, key, payload)
+
+        return payload
+
+    def put(self, label: str, key: str, payload: bytes) -> None:
+        self._put_memory(label, key, payload)
+        self._write_disk(label, key, payload)
+
+    def invalidate(self, video_hash: str) -> None:
+        """
+        Drop the entries of the video, and the combined ones as they may include the video too.
+        """
+        labels = {video_hash, COMBINED_LABEL}
+
+        with self._lock:
+            for key in [k for k, (label, _) in self._entries.items() if label in labels]:
+                self._total_bytes -= len(self._entries.pop(key)[1])
+
+        if self._disk_dir is not None:
+            for label in labels:
+                for path in glob.glob(os.path.join(self._disk_dir, f"{label}_*.json")):
+                    _remove_file(path)
+
+    def clear(self) -> None:
+        """
+        Drop all the entries, e.g. when the figures are rendered differently from now on.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+        if self._disk_dir is not None:
+            for path in glob.glob(os.path.join(self._disk_dir, "*.json")):
+                _remove_file(path)
+
+    def _put_memory(self, label: str, key: str, payload: bytes) -> None:
+        if len(payload) > self._max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= len(self._entries.pop(key)[1])
+
+            self._entries[key] = (label, payload)
+            self._total_bytes += len(payload)
+
+            while self._total_bytes > self._max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._total_bytes -= len(evicted)
+
+    def _disk_path(self, label: str, key: str) -> str:
+        return os.path.join(self._disk_dir, f"{label}_{key}.json")
+
+    def _read_disk(self, label: str, key: str) -> bytes | None:
+        if self._disk_dir is None:
+            return None
+
+        path = self._disk_path(label, key)
+        try:
+            with open(path, "rb") as fp:
+                payload = fp.read()
+        except FileNotFoundError:
+            return None
+
+        # Refresh the modification time, the disk tier evicts the least recently used files by it.
+        os.utime(path)
+
+        return payload
+
+    def _write_disk(self, label: str, key: str, payload: bytes) -> None:
+        if self._disk_dir is None or len(payload) > self._max_disk_bytes:
+            return
+
+        os.makedirs(self._disk_dir, exist_ok=True)
+
+        path = self._disk_path(label, key)
+        tmp_path = f"{path}.tmp-{threading.get_ident()}"
+        with open(tmp_path, "wb") as fp:
+            fp.write(payload)
+        os.replace(tmp_path, path)
+
+        files = []
+        for file_path in glob.glob(os.path.join(self._disk_dir, "*.json")):
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, file_path))
+
+        total_size = sum(size for _, size, _ in files)
+        for _, size, file_path in sorted(files):
+            if total_size <= self._max_disk_bytes:
+                break
+
+            _remove_file(file_path)
+            total_size -= size
+
+
+_figure_cache: FigureCache | None = None
+
+
+def get_figure_cache() -> FigureCache:
+    global _figure_cache
+
+    if _figure_cache is None:
+        _figure_cache = FigureCache.from_env()
+
+    return _figure_cache
+
+
+def build_cache_key(*parts) -> str:
+    return sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
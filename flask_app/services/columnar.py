@@ -0,0 +1,141 @@
+"""
+A tiny columnar container for the data derived from VOD chats.
+
+File layout::
+
+    MAGIC (8 bytes) | header size (uint64 LE) | JSON header | padding | column data ...
+
+The header describes every column (dtype, byte offset, length) plus arbitrary JSON metadata.  Each column is stored
+as a contiguous little-endian array aligned to 8 bytes, so readers map the file once and get zero-copy views.
+"""
+import json
+import struct
+from typing import BinaryIO
+
+import numpy as np
+
+MAGIC = b"VCACOL01"
+ALIGNMENT = 8
+
+_HEADER_SIZE_FORMAT = "<Q"
+_PREAMBLE_SIZE = len(MAGIC) + struct.calcsize(_HEADER_SIZE_FORMAT)
+
+
+class ColumnarData:
+    def __init__(self, columns: dict[str, np.ndarray], meta: dict):
+        self._columns: dict[str, np.ndarray] = columns
+        self._meta: dict = meta
+
+    @property
+    def columns(self) -> dict[str, np.ndarray]:
+        return self._columns
+
+    @property
+    def meta(self) -> dict:
+        return self._meta
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._columns
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self._columns[name]
+
+
+def write_columns(fp: BinaryIO, columns: dict[str, np.ndarray], meta: dict | None = None) -> None:
+    arrays = {name: _to_little_endian(np.asarray(values)) for name, values in columns.items()}
+
+    layout = {}
+    offset = 0
+    for name, values in arrays.items():
+        layout[name] = {
+            "dtype": values.dtype.str,
+            "offset": offset,
+            "length": len(values),
+        }
+        offset = _align(offset + values.nbytes)
+
+    header = json.dumps({"columns": layout, "meta": meta or {}}, ensure_ascii=False).encode("utf-8")
+    header += b" " * (_align(_PREAMBLE_SIZE + len(header)) - _PREAMBLE_SIZE - len(header))
+
+    fp.write(MAGIC)
+    fp.write(struct.pack(_HEADER_SIZE_FORMAT, len(header)))
+    fp.write(header)
+
+    written = 0
+    for name, values in arrays.items():
+        padding = layout[name]["offset"] - written
+        if padding:
+            fp.write(b"\0" * padding)
+
+        fp.write(values.tobytes())
+        written = layout[name]["offset"] + values.nbytes
+
+    if written < offset:
+        fp.write(b"\0" * (offset - written))
+
+
+def read_meta(file_path: str) -> dict | None:
+    """
+    Read the metadata only, without mapping the columns.
+    """
+    try:
+        header, _ = _read_header(file_path)
+    except FileNotFoundError:
+        return None
+
+    return header["meta"]
+
+
+def read_columns(file_path: str, copy: bool = False) -> ColumnarData | None:
+    """
+    The columns are read-only views of the file mapped into memory.  The `copy` reads the file into memory instead,
+    e.g. for a file which gets replaced while the columns are in use, as a mapped file can't be replaced on Windows.
+    """
+    try:
+        header, data_offset = _read_header(file_path)
+    except FileNotFoundError:
+        return None
+
+    columns_layout: dict[str, dict] = header["columns"]
+    data_size = max((c["offset"] + c["length"] * np.dtype(c["dtype"]).itemsize for c in columns_layout.values()),
+                    default=0)
+
+    if data_size and copy:
+        buffer = np.fromfile(file_path, dtype=np.uint8, count=data_size, offset=data_offset)
+        buffer.flags.writeable = False
+    elif data_size:
+        buffer = np.memmap(file_path, dtype=np.uint8, mode="r", offset=data_offset, shape=(data_size,))
+    else:
+        buffer = np.empty(0, dtype=np.uint8)
+
+    columns = {}
+    for name, column in columns_layout.items():
+        dtype = np.dtype(column["dtype"])
+        start = column["offset"]
+        stop = start + column["length"] * dtype.itemsize
+        columns[name] = buffer[start:stop].view(dtype)
+
+    return ColumnarData(columns, header["meta"])
+
+
+def _read_header(file_path: str) -> tuple[dict, int]:
+    """
+    Return the header and the offset of the column data.
+    """
+    with open(file_path, "rb") as fp:
+        preamble = fp.read(_PREAMBLE_SIZE)
+        if len(preamble) != _PREAMBLE_SIZE or preamble[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"File '{file_path}' is not a columnar container")
+
+        header_size, = struct.unpack(_HEADER_SIZE_FORMAT, preamble[len(MAGIC):])
+        header = json.loads(fp.read(header_size))
+
+    return header, _PREAMBLE_SIZE + header_size
+
+
+def _to_little_endian(values: np.ndarray) -> np.ndarray:
+    return np.ascontiguousarray(values.astype(values.dtype.newbyteorder("<"), copy=False))
+
+
+def _align(size: int) -> int:
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
@@ -1,9 +1,27 @@
+import threading
+import time
+import traceback
 from abc import ABC
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
 from datetime import datetime
 from importlib.metadata import entry_points
+from os import getenv
+from typing import Any, Callable
 
+import numpy as np
+from plotly.basedatatypes import BaseTraceType
 from plotly.graph_objs import Figure
 
+from flask_app.services.cache import get_figure_cache
+from flask_app.services.utils import SecondsHistogram
+
+# The entry point groups of the figure updaters, by the version of their contract
+FIGURE_UPDATER_V1_GROUP = "chat_analyzer.v1.vod_chat.subplots"
+FIGURE_UPDATER_V2_GROUP = "chat_analyzer.v2.vod_chat.subplots"
+# The data a v2 figure updater can require: the sorted timestamps (in microseconds) of the messages and of every emote,
+# or their per-second histograms.
+VOD_CHAT_DATA = frozenset({"messages", "emoticons", "messages_histogram", "emoticons_histograms"})
+
 
 class VodChatFigureUpdater(ABC):
     def __init__(
@@ -72,27 +90,304 @@ class VodChatFigureUpdater(ABC):
         raise NotImplementedError
 
 
+class VodChatFigureUpdaterV2(ABC):
+    """
+    The v2 contract of the figure extensions, they are discovered in the "chat_analyzer.v2.vod_chat.subplots" group.
+
+    An updater declares the data it's built with by `required_data`, and whether it applies to a VOD at all by
+    `is_applicable()`, so nothing is loaded for the updaters which don't.  The traces are built by `build_traces()` in
+    a worker thread, concurrently with the other updaters and within a time budget; the figure itself is modified on
+    the request thread only.
+    """
+
+    # Any of the `VOD_CHAT_DATA` names, the data are passed to the constructor by them
+    required_data: frozenset[str] = frozenset()
+    # The heights of the own subplots, in pixels
+    subplot_heights: tuple[int, ...] = ()
+
+    def __init__(self, data: dict[str, Any], vod_data: dict | None = None):
+        self._data: dict[str, Any] = data
+        self._vod_data: dict | None = vod_data
+
+        self._figure_rows: list[int] = []
+        self._traces_missing: bool = False
+
+    @classmethod
+    def is_applicable(cls, vod_data: dict | None) -> bool:
+        return True
+
+    @property
+    def figure_total_rows(self) -> int:
+        return len(self.figure_subplot_heights)
+
+    @property
+    def figure_subplot_heights(self) -> list[int]:
+        return list(self.subplot_heights)
+
+    @property
+    def traces_missing(self) -> bool:
+        """
+        Whether the traces were left out of the figure, because they failed or took too long to build.
+        """
+        return self._traces_missing
+
+    def assign_figure_rows(self, row_numbers: list[int]) -> None:
+        self._figure_rows = row_numbers
+
+    def find_start_timestamp(self) -> datetime | None:
+        return None
+
+    def build_traces(self, origin: datetime) -> list[tuple[BaseTraceType, int]]:
+        """
+        Return the traces with the index of the own subplot each one belongs to.
+
+        The X values are the seconds since the `origin`, the same as the ones of the chat charts.  It's called in
+        a worker thread.
+        """
+        raise NotImplementedError
+
+    def update_figure(self, fig: Figure, xaxis_title: str) -> None:
+        """
+        Style the own subplots, it's called on the request thread after the traces have been added.
+        """
+        pass
+
+    def apply_traces(self, fig: Figure, traces: list[tuple[BaseTraceType, int]], xaxis_title: str) -> None:
+        for trace, subplot_index in traces:
+            fig.add_trace(trace, row=self._figure_rows[subplot_index], col=1)
+
+        self.update_figure(fig, xaxis_title)
+
+
+class FigureTracesBuild:
+    """
+    The traces of the v2 updaters being built in the shared worker threads.
+
+    Every updater gets the time budget since it has started running, and at most the same time to wait for a free
+    worker.  The late and the failed updaters are left out of the figure, and marked by `traces_missing`.
+    """
+
+    def __init__(self, updaters: list[VodChatFigureUpdaterV2], origin: datetime, time_budget: float | None = None):
+        if time_budget is None:
+            time_budget = float(getenv("EXTENSIONS_TIME_BUDGET", 5))
+
+        self._time_budget: float = time_budget
+        self._submitted_at: float = time.monotonic()
+        self._started_at: dict[VodChatFigureUpdaterV2, float] = {}
+        self._started: dict[VodChatFigureUpdaterV2, threading.Event] = {u: threading.Event() for u in updaters}
+
+        self._executor: ThreadPoolExecutor | None = _get_traces_executor() if updaters else None
+        self._futures: dict[VodChatFigureUpdaterV2, Future] = {
+            updater: self._executor.submit(self._build_traces, updater, origin) for updater in updaters
+        }
+
+    def _build_traces(self, updater: VodChatFigureUpdaterV2, origin: datetime) -> list[tuple[BaseTraceType, int]]:
+        self._started_at[updater] = time.monotonic()
+        self._started[updater].set()
+
+        return updater.build_traces(origin)
+
+    def collect(self) -> dict[VodChatFigureUpdaterV2, list[tuple[BaseTraceType, int]]]:
+        result = {}
+        for updater, future in self._futures.items():
+            name = type(updater).__name__
+
+            try:
+                result[updater] = self._wait(updater, future)
+            except TimeoutError:
+                updater._traces_missing = True
+
+                # A running updater can't be stopped, so its worker is left to it and the next builds get a new pool.
+                if not future.cancel():
+                    _discard_traces_executor(self._executor)
+
+                print(
+                    f"Figure updater '{name}' exceeded its {self._time_budget:g}s time budget, its traces are left out",
+                    flush=True,
+                )
+            except Exception:
+                updater._traces_missing = True
+
+                print(f"Figure updater '{name}' failed to build its traces, they are left out", flush=True)
+                traceback.print_exc()
+
+        return result
+
+    def _wait(self, updater: VodChatFigureUpdaterV2, future: Future) -> list[tuple[BaseTraceType, int]]:
+        if not self._started[updater].wait(max(self._submitted_at + self._time_budget - time.monotonic(), 0)):
+            raise TimeoutError()
+
+        return future.result(timeout=max(self._started_at[updater] + self._time_budget - time.monotonic(), 0))
+
+
+_traces_executor: ThreadPoolExecutor | None = None
+_traces_executor_lock = threading.Lock()
+
+
+def _get_traces_executor() -> ThreadPoolExecutor:
+    global _traces_executor
+
+    with _traces_executor_lock:
+        if _traces_executor is None:
+            _traces_executor = ThreadPoolExecutor(
+                max_workers=int(getenv("EXTENSIONS_WORKERS", 4)),
+                thread_name_prefix="figure-updater",
+            )
+
+    return _traces_executor
+
+
+def _discard_traces_executor(executor: ThreadPoolExecutor) -> None:
+    global _traces_executor
+
+    # The queued updaters of the running builds still run, and the idle workers exit once the pool is released by
+    # them.  It's not shut down, so a build which has just got the pool can still submit to it.
+    with _traces_executor_lock:
+        if _traces_executor is executor:
+            _traces_executor = None
+
+
+def has_missing_traces(extensions: list[VodChatFigureUpdater | VodChatFigureUpdaterV2]) -> bool:
+    return any(isinstance(ext, VodChatFigureUpdaterV2) and ext.traces_missing for ext in extensions)
+
+
+def figure_extensions_fingerprint() -> list:
+    """
+    The modules and the versions of the installed figure updaters, the rendered figures depend on them.
+    """
+    result = []
+    for group in [FIGURE_UPDATER_V1_GROUP, FIGURE_UPDATER_V2_GROUP]:
+        discover_extensions(group, "figure_updater")
+
+        with _extensions_lock:
+            result.append([group, _extensions_versions.get((group, "figure_updater"), [])])
+
+    return result
+
+
 def load_vod_chat_figure_extensions(
-        messages: list[int],
-        emoticons: dict[str, list[int]],
+        messages: np.ndarray,
+        emoticons: dict[str, np.ndarray],
         vod_data: dict | None = None,
-) -> list[VodChatFigureUpdater]:
-    discovered_extensions = entry_points(group="chat_analyzer.v1.vod_chat.subplots", name="figure_updater")
+        data_loaders: dict[str, Callable[[], Any]] | None = None,
+) -> list[VodChatFigureUpdater | VodChatFigureUpdaterV2]:
+    """
+    Create the figure updaters of the VOD, the `data_loaders` provide the data the v2 updaters may require besides
+    the timestamps.
+    """
+    discovered_extensions = discover_extensions(FIGURE_UPDATER_V1_GROUP, "figure_updater")
+
+    if discovered_extensions:
+        # The v1 updaters get the plain lists of their contract
+        v1_messages = messages.tolist()
+        v1_emoticons = {emoticon: timestamps.tolist() for emoticon, timestamps in emoticons.items()}
 
-    result: list[VodChatFigureUpdater] = []
-    for extension in sorted(discovered_extensions):
+    result: list[VodChatFigureUpdater | VodChatFigureUpdaterV2] = []
+    for module, figure_updater_cls in discovered_extensions:
         try:
-            figure_updater_cls = extension.load()
-            figure_updater: VodChatFigureUpdater = figure_updater_cls(messages, emoticons, vod_data)
+            figure_updater: VodChatFigureUpdater = figure_updater_cls(v1_messages, v1_emoticons, vod_data)
 
             if figure_updater:
                 print(
-                    f"Successfully loaded VOD-chat figure updater '{figure_updater_cls.__name__}' from '{extension.module}' extension",
+                    f"Successfully loaded VOD-chat figure updater '{figure_updater_cls.__name__}' from '{module}' extension",
                     flush=True,
                 )
                 result.append(figure_updater)
         except Exception:
-            print(f"Failed to load a VOD-chat figure updater from '{extension.module}' extension", flush=True)
+            print(f"Failed to load a VOD-chat figure updater from '{module}' extension", flush=True)
+            raise
+
+    data_loaders = {"messages": lambda: messages, "emoticons": lambda: emoticons, **(data_loaders or {})}
+    loaded_data = {}
+
+    for module, figure_updater_cls in discover_extensions(FIGURE_UPDATER_V2_GROUP, "figure_updater"):
+        try:
+            if not figure_updater_cls.is_applicable(vod_data):
+                continue
+
+            for name in figure_updater_cls.required_data - loaded_data.keys():
+                loaded_data[name] = _to_memory(data_loaders[name]())
+
+            result.append(figure_updater_cls({name: loaded_data[name] for name in figure_updater_cls.required_data}, vod_data))
+        except Exception:
+            print(f"Failed to load a VOD-chat figure updater from '{module}' extension", flush=True)
             raise
 
     return result
+
+
+def _to_memory(data: Any) -> Any:
+    """
+    Copy the arrays mapped from the data files into memory, keeping them read-only.
+
+    The traces of an updater may still be built after the request (a hung updater keeps its thread), and a mapped file
+    can't be replaced on Windows, so the updaters never hold the mapped arrays.
+    """
+    if isinstance(data, np.ndarray):
+        data = np.array(data)
+        data.flags.writeable = False
+    elif isinstance(data, SecondsHistogram):
+        data = SecondsHistogram(data.start, _to_memory(data.counts))
+    elif isinstance(data, dict):
+        data = {key: _to_memory(value) for key, value in data.items()}
+
+    return data
+
+
+_extensions: dict[tuple[str, str], list[tuple[str, Any]]] = {}
+# The `(entry point, distribution)` pairs of the discovered entry points, e.g. `("ext:Updater", "ext==1.0")`
+_extensions_versions: dict[tuple[str, str], list[tuple[str, str | None]]] = {}
+_extensions_generation: int = 0
+_extensions_lock = threading.Lock()
+
+
+def discover_extensions(group: str, name: str) -> list[tuple[str, Any]]:
+    """
+    Return the loaded entry points of the group as `(module, object)` pairs.
+
+    The metadata of the installed distributions are scanned once per process, the next call after
+    `reload_extensions()` scans them again.
+    """
+    key = (group, name)
+
+    with _extensions_lock:
+        if key not in _extensions:
+            loaded = []
+            versions = []
+            for extension in sorted(entry_points(group=group, name=name)):
+                try:
+                    loaded.append((extension.module, extension.load()))
+                    dist = extension.dist
+                    versions.append((extension.value, f"{dist.name}=={dist.version}" if dist else None))
+                except Exception:
+                    print(f"Failed to load '{group}' entry point from '{extension.module}' extension", flush=True)
+                    raise
+
+            _extensions[key] = loaded
+            _extensions_versions[key] = versions
+
+        return _extensions[key]
+
+
+def reload_extensions() -> None:
+    """
+    Forget the discovered extensions, so the installed or removed ones are picked up without a restart.
+
+    The cached figures are dropped too.  The already imported modules are not imported again, and the blueprints are
+    registered at the startup only.
+    """
+    global _extensions_generation
+
+    with _extensions_lock:
+        _extensions.clear()
+        _extensions_versions.clear()
+        _extensions_generation += 1
+
+    get_figure_cache().clear()
+
+
+def extensions_generation() -> int:
+    """
+    The number of the extension reloads, the values built from the extensions are rebuilt when it changes.
+    """
+    return _extensions_generation
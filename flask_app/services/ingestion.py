@@ -0,0 +1,389 @@
+import json
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Iterable
+from uuid import uuid4
+
+import numpy as np
+
+from flask_app.services.columnar import write_columns
+from flask_app.services.lib import (
+    EMOTICONS_HISTOGRAM_PREFIX,
+    MESSAGES_HISTOGRAM_COLUMN,
+    TIMESTAMPS_COLUMN,
+    EmoticonsMatcher,
+    custom_emoticons_version,
+)
+from flask_app.services.utils import SecondsHistogram, json_loads
+
+# Smaller chat files are parsed in the current process, spawning the workers would take longer
+MIN_SHARD_SIZE = 32 * 1024 * 1024
+
+
+class ChatStatsCollector:
+    """
+    Accumulate the message and emote timestamps of a VOD chat in a single pass.
+
+    The collector tracks the byte offset of the trailing group of messages sharing the same `time_in_seconds`,
+    because this group is the one that gets truncated and downloaded again on a chat update.  The offset and the
+    contributions of the group are saved as a checkpoint, so the next run resumes from there instead of re-parsing the
+    whole chat.
+    """
+
+    def __init__(self, custom_emoticons: set[str]):
+        self._custom_emoticons: set[str] = custom_emoticons
+        self._emoticons_matcher = EmoticonsMatcher(custom_emoticons)
+        self._revision: str = uuid4().hex
+
+        self._base_messages: np.ndarray = np.empty(0, dtype=np.int64)
+        self._base_emoticons: dict[str, np.ndarray] = {}
+
+        self._messages: list[int] = []
+        self._emoticons: dict[str, list[int]] = {}
+        # Timestamps of the shards parsed by other processes, they are merged together with the own ones
+        self._shards_messages: list[np.ndarray] = []
+        self._shards_emoticons: dict[str, list[np.ndarray]] = {}
+
+        self._resumable: bool = True
+        self._offset: int = 0
+        self._tail_offset: int = 0
+        self._tail_second: int | None = None
+        self._tail_messages: list[int] = []
+        self._tail_emoticons: dict[str, list[int]] = {}
+
+        self._merged: tuple[np.ndarray, dict[str, np.ndarray]] | None = None
+
+    @property
+    def custom_emoticons(self) -> set[str]:
+        return self._custom_emoticons
+
+    @property
+    def checkpoint(self) -> dict | None:
+        if not self._resumable:
+            return None
+
+        return {
+            "offset": self._tail_offset,
+            "last_second": self._tail_second,
+            "size": self._offset,
+            "tail_messages": self._tail_messages,
+            "tail_emoticons": self._tail_emoticons,
+        }
+
+    @property
+    def tail_boundary(self) -> dict | None:
+        """
+        The chat file offset where the trailing group of messages starts, and their second.
+        """
+        if self._tail_second is None:
+            return None
+
+        return {"offset": self._tail_offset, "second": self._tail_second}
+
+    def add_message(self, message: dict, size: int = 0) -> None:
+        """
+        Count the message, the `size` is a length of its line in the chat file in bytes.
+        """
+        seconds = int(message["time_in_seconds"])
+
+        if seconds != self._tail_second:
+            self._tail_offset = self._offset
+            self._tail_second = seconds
+            self._tail_messages = []
+            self._tail_emoticons = {}
+
+        self._offset += size
+
+        # The messages sent before the stream start are skipped, the second they are grouped by is rounded toward zero.
+        if message["time_in_seconds"] < 0:
+            return
+
+        self._merged = None
+
+        timestamp = message["timestamp"]
+        self._messages.append(timestamp)
+        self._tail_messages.append(timestamp)
+
+        message_emotes = self._emoticons_matcher.match(message["message"], message.get("emotes", []))
+        for emoticon in message_emotes:
+            if emoticon not in self._emoticons:
+                self._emoticons[emoticon] = []
+
+            self._emoticons[emoticon].append(timestamp)
+            self._tail_emoticons.setdefault(emoticon, []).append(timestamp)
+
+    def add_lines(self, lines: Iterable[bytes]) -> None:
+        for line in lines:
+            self.add_message(json_loads(line), len(line))
+
+    def add_chat_file(self, file_path: str, offset: int = 0, max_workers: int | None = None) -> None:
+        """
+        Parse the chat file from the offset, huge files are split into line-aligned shards parsed in parallel.
+        """
+        max_workers = max_workers or os.cpu_count() or 1
+        boundaries = split_into_shards(file_path, offset, max_workers, MIN_SHARD_SIZE)
+
+        if len(boundaries) <= 2:
+            with open(file_path, "rb") as fp:
+                fp.seek(offset)
+                self.add_lines(fp)
+
+            return
+
+        # Workers are spawned, because forking a process running threads (Flask, the jobs pool) isn't safe.
+        with ProcessPoolExecutor(len(boundaries) - 1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            shards = executor.map(
+                collect_shard,
+                [file_path] * (len(boundaries) - 1),
+                boundaries[:-1],
+                boundaries[1:],
+                [self._custom_emoticons] * (len(boundaries) - 1),
+            )
+
+            for shard in shards:
+                self.add_shard(shard)
+
+    def parse_shard(self, file_path: str, start: int, stop: int) -> dict:
+        """
+        Parse the `[start, stop)` byte range of the chat file into this new collector, then return the shard results.
+
+        The start must be a line start.  The results are added to the collector of the whole chat in the file order.
+        """
+        self._offset = self._tail_offset = start
+
+        with open(file_path, "rb") as fp:
+            fp.seek(start)
+
+            position = start
+            for line in fp:
+                if position >= stop:
+                    break
+
+                self.add_message(json_loads(line), len(line))
+                position += len(line)
+
+        return {
+            "start": start,
+            "stop": stop,
+            "messages": to_sorted_array(self._messages),
+            "emoticons": {emoticon: to_sorted_array(timestamps) for emoticon, timestamps in self._emoticons.items()},
+            "tail_offset": self._tail_offset,
+            "tail_second": self._tail_second,
+            "tail_messages": self._tail_messages,
+            "tail_emoticons": self._tail_emoticons,
+        }
+
+    def add_shard(self, shard: dict) -> None:
+        """
+        Append the results of the next shard, the shards must come in the file order.
+        """
+        self._merged = None
+        self._offset = shard["stop"]
+
+        self._shards_messages.append(shard["messages"])
+        for emoticon, timestamps in shard["emoticons"].items():
+            self._shards_emoticons.setdefault(emoticon, []).append(timestamps)
+
+        # The trailing group of messages continues from the previous shard, if the whole shard is the same second.
+        if shard["tail_offset"] == shard["start"] and shard["tail_second"] == self._tail_second:
+            self._tail_messages.extend(shard["tail_messages"])
+            for emoticon, timestamps in shard["tail_emoticons"].items():
+                self._tail_emoticons.setdefault(emoticon, []).extend(timestamps)
+        elif shard["tail_second"] is not None:
+            self._tail_offset = shard["tail_offset"]
+            self._tail_second = shard["tail_second"]
+            self._tail_messages = shard["tail_messages"]
+            self._tail_emoticons = shard["tail_emoticons"]
+
+    def seed(self, messages: Iterable[int], emoticons: dict[str, Iterable[int]]) -> None:
+        """
+        Start from already counted timestamps, e.g. the ones migrated from legacy files.
+
+        There is no known chat offset for such timestamps, so the outputs will not have a checkpoint.
+        """
+        self._resumable = False
+        self._base_messages = to_sorted_array(messages)
+        self._base_emoticons = {emoticon: to_sorted_array(timestamps) for emoticon, timestamps in emoticons.items()}
+
+    def resume(self, messages: np.ndarray, emoticons: dict[str, np.ndarray], checkpoint: dict) -> int:
+        """
+        Start from the outputs of a previous run, then return the chat file offset to continue the parsing from.
+
+        The contributions of the trailing group of the previous run are discarded, because the group is parsed again.
+        The timestamps are copied, so the files they are mapped from can be replaced by the new outputs.
+        """
+        self._base_messages = remove_timestamps(messages, checkpoint["tail_messages"])
+
+        self._base_emoticons = {}
+        for emoticon, timestamps in emoticons.items():
+            timestamps = remove_timestamps(timestamps, checkpoint["tail_emoticons"].get(emoticon, []))
+
+            if len(timestamps):
+                self._base_emoticons[emoticon] = timestamps
+
+        self._offset = self._tail_offset = checkpoint["offset"]
+        self._tail_second = None
+
+        return self._offset
+
+    def recount_emoticons(self, file_path: str, emoticons: set[str], stop: int) -> None:
+        """
+        Count the emoticons again in the first `stop` bytes of the chat, e.g. after the custom emoticons changed.
+
+        Only the lines mentioning any of the emoticons are parsed, the rest of the already counted data is kept.
+        """
+        if not emoticons:
+            return
+
+        # Non-ASCII names may be escaped in the JSON lines, so look for both forms.
+        needles = {e.encode("utf-8") for e in emoticons} | {json.dumps(e)[1:-1].encode("utf-8") for e in emoticons}
+        pattern = re.compile(b"|".join(map(re.escape, needles)))
+
+        recounted = {emoticon: [] for emoticon in emoticons}
+        with open(file_path, "rb") as fp:
+            position = 0
+            for line in fp:
+                if position >= stop:
+                    break
+                position += len(line)
+
+                if not pattern.search(line):
+                    continue
+
+                message = json_loads(line)
+                if message["time_in_seconds"] < 0:
+                    continue
+
+                for emoticon in self._emoticons_matcher.match(message["message"], message.get("emotes", [])):
+                    if emoticon in recounted:
+                        recounted[emoticon].append(message["timestamp"])
+
+        self._merged = None
+        for emoticon, timestamps in recounted.items():
+            if timestamps:
+                self._base_emoticons[emoticon] = to_sorted_array(timestamps)
+            else:
+                self._base_emoticons.pop(emoticon, None)
+
+    def write_timestamps(self, fp: BinaryIO) -> None:
+        messages, _ = self._merge()
+
+        write_columns(fp, {TIMESTAMPS_COLUMN: messages}, {
+            "revision": self._revision,
+            "checkpoint": self.checkpoint,
+        })
+
+    def write_emoticons(self, fp: BinaryIO) -> None:
+        _, emoticons = self._merge()
+
+        write_columns(fp, emoticons, {
+            "revision": self._revision,
+            "custom_emoticons": sorted(self._custom_emoticons),
+            "custom_emoticons_version": custom_emoticons_version(self._custom_emoticons),
+        })
+
+    def write_histograms(self, fp: BinaryIO) -> None:
+        """
+        Write the per-second counts of messages and emotes, so graphs never have to touch the raw timestamps.
+
+        The counts of a rare emote spread over a long time take more space than its timestamps, so such emotes are
+        skipped and counted from the timestamps on demand.
+        """
+        messages, emoticons = self._merge()
+
+        histograms = {MESSAGES_HISTOGRAM_COLUMN: SecondsHistogram.from_timestamps(messages)}
+        for emoticon, timestamps in emoticons.items():
+            histogram = SecondsHistogram.from_timestamps(timestamps)
+
+            if len(histogram.counts) <= 2 * len(timestamps):
+                histograms[EMOTICONS_HISTOGRAM_PREFIX + emoticon] = histogram
+
+        write_columns(fp, {name: h.counts.astype(np.uint32) for name, h in histograms.items()}, {
+            "revision": self._revision,
+            "starts": {name: h.start for name, h in histograms.items()},
+        })
+
+    def _merge(self) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+        """
+        Merge all the counted timestamps, then keep them as the base, so the next merge only sorts the new ones in.
+        """
+        if self._merged is None:
+            messages = merge_sorted_arrays([
+                self._base_messages,
+                *self._shards_messages,
+                to_sorted_array(self._messages),
+            ])
+
+            emoticons = {}
+            for emoticon in {**self._base_emoticons, **self._shards_emoticons, **self._emoticons}:
+                emoticons[emoticon] = merge_sorted_arrays([
+                    self._base_emoticons.get(emoticon, np.empty(0, dtype=np.int64)),
+                    *self._shards_emoticons.get(emoticon, []),
+                    to_sorted_array(self._emoticons.get(emoticon, [])),
+                ])
+
+            self._base_messages, self._base_emoticons = messages, emoticons
+            self._messages, self._emoticons = [], {}
+            self._shards_messages, self._shards_emoticons = [], {}
+
+            self._merged = messages, emoticons
+
+        return self._merged
+
+
+def split_into_shards(file_path: str, offset: int, max_shards: int, min_shard_size: int) -> list[int]:
+    """
+    Return the boundaries of byte ranges from the offset to the end of the file, every boundary is a line start.
+    """
+    with open(file_path, "rb") as fp:
+        size = fp.seek(0, os.SEEK_END)
+
+        shards_count = max(min(max_shards, (size - offset) // min_shard_size), 1)
+        shard_size = (size - offset) // shards_count
+
+        boundaries = [offset]
+        for i in range(1, shards_count):
+            fp.seek(offset + i * shard_size - 1)
+            fp.readline()
+
+            if boundaries[-1] < fp.tell() < size:
+                boundaries.append(fp.tell())
+
+        boundaries.append(size)
+
+    return boundaries
+
+
+def collect_shard(file_path: str, start: int, stop: int, custom_emoticons: set[str]) -> dict:
+    """
+    Parse the `[start, stop)` byte range of the chat file, it runs in a worker process.
+    """
+    return ChatStatsCollector(custom_emoticons).parse_shard(file_path, start, stop)
+
+
+def to_sorted_array(timestamps: Iterable[int]) -> np.ndarray:
+    # Chat messages are almost ordered, so the stable sort (Timsort) runs in nearly linear time.
+    return np.sort(np.asarray(timestamps, dtype=np.int64), kind="stable")
+
+
+def merge_sorted_arrays(arrays: list[np.ndarray]) -> np.ndarray:
+    # Timsort detects the pre-sorted runs, so it merges them instead of sorting from scratch.
+    return np.sort(np.concatenate(arrays), kind="stable")
+
+
+def remove_timestamps(timestamps: np.ndarray, removed: Iterable[int]) -> np.ndarray:
+    """
+    Remove one occurrence of every removed value from the sorted timestamps.
+    """
+    values, counts = np.unique(np.asarray(removed, dtype=np.int64), return_counts=True)
+
+    starts = np.searchsorted(timestamps, values, side="left")
+    stops = np.searchsorted(timestamps, values, side="right")
+
+    mask = np.ones(len(timestamps), dtype=bool)
+    for start, count in zip(starts, np.minimum(counts, stops - starts)):
+        mask[start:start + count] = False
+
+    return timestamps[mask]
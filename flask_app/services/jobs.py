@@ -0,0 +1,236 @@
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from os import getenv
+from typing import Callable
+from uuid import uuid4
+
+from filelock import Timeout
+
+from flask_app.services.utils import lock_file_path, read_json_file, write_json_file
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+ACTIVE_JOB_STATUSES = {JOB_QUEUED, JOB_RUNNING}
+
+# Downloads mostly wait for the network, while the processing is bound by CPU, so they run in separate pools
+NETWORK_POOL = "network"
+CPU_POOL = "cpu"
+
+# An active job is considered abandoned (e.g. its process was killed) once its heartbeat is older than this
+HEARTBEAT_INTERVAL = 10  # In seconds
+HEARTBEAT_TIMEOUT = 6 * HEARTBEAT_INTERVAL
+FINISHED_JOBS_LIMIT = 100
+# The jobs table lock waits for a second only, a status update tries again this many times
+UPDATE_ATTEMPTS = 5
+
+JobHandler = Callable[[str], bool]
+JobStage = tuple[str, JobHandler]
+
+
+class JobQueue:
+    """
+    Run long VOD chat jobs (downloads, updates) in bounded pools of background threads.
+
+    A job is a sequence of stages, each stage runs in its own pool, e.g. the processing of a VOD is queued into the
+    CPU pool as soon as its download finishes in the network pool.
+
+    The jobs are stored in a JSON table under `data/`, so their status survives restarts and is shared by all the
+    processes of the app.  A VOD has at most one active job: enqueueing another one returns the active job instead.
+    """
+
+    def __init__(self, table_path: str, pools: dict[str, int]):
+        self._table_path: str = table_path
+        self._executors: dict[str, ThreadPoolExecutor] = {
+            name: ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"job-{name}")
+            for name, max_workers in pools.items()
+        }
+        self._stages: dict[str, list[JobStage]] = {}
+
+        self._owned_jobs: set[str] = set()
+        self._lock = threading.Lock()
+        self._heartbeat: threading.Thread | None = None
+
+    @classmethod
+    def from_env(cls) -> "JobQueue":
+        return cls(
+            table_path="data/jobs.json",
+            pools={
+                NETWORK_POOL: int(getenv("JOBS_NETWORK_WORKERS", 4)),
+                CPU_POOL: int(getenv("JOBS_CPU_WORKERS", 2)),
+            },
+        )
+
+    def register(self, kind: str, stages: list[JobStage]) -> None:
+        """
+        Every stage is a pool name and a handler, the handler gets a VOD URL and returns whether the stage succeeded.
+        """
+        for pool, _ in stages:
+            if pool not in self._executors:
+                raise ValueError(f"Unknown jobs pool '{pool}'")
+
+        self._stages[kind] = stages
+
+    def enqueue(self, kind: str, video_hash: str, url: str) -> dict:
+        if kind not in self._stages:
+            raise ValueError(f"Unknown job kind '{kind}'")
+
+        now = time.time()
+
+        with lock_file_path(self._table_path):
+            jobs = self._read_table()
+
+            job = _find_active_job(jobs, video_hash)
+            if job is not None and (self._is_owned(job["id"]) or now - job["heartbeat_at"] <= HEARTBEAT_TIMEOUT):
+                return job
+
+            if job is None:
+                job = {"id": uuid4().hex, "video_hash": video_hash, "created_at": now}
+                jobs[job["id"]] = job
+
+            # An abandoned job is taken over, the tasks continue from what has been saved already.
+            job.update(
+                kind=kind,
+                url=url,
+                status=JOB_QUEUED,
+                stage=0,
+                error=None,
+                updated_at=now,
+                heartbeat_at=now,
+            )
+
+            self._write_table(jobs)
+
+        with self._lock:
+            self._owned_jobs.add(job["id"])
+            self._start_heartbeat()
+
+        self._submit(job["id"], kind, url, 0)
+
+        return job
+
+    def get(self, job_id: str) -> dict | None:
+        return self._read_table().get(job_id)
+
+    def find_active(self, video_hash: str) -> dict | None:
+        return _find_active_job(self._read_table(), video_hash)
+
+    def _submit(self, job_id: str, kind: str, url: str, stage: int) -> None:
+        pool, _ = self._stages[kind][stage]
+
+        self._executors[pool].submit(self._run, job_id, kind, url, stage)
+
+    def _is_owned(self, job_id: str) -> bool:
+        with self._lock:
+            return job_id in self._owned_jobs
+
+    def _run(self, job_id: str, kind: str, url: str, stage: int) -> None:
+        _, handler = self._stages[kind][stage]
+        try:
+            self._update(job_id, status=JOB_RUNNING, stage=stage)
+            success = handler(url)
+
+            if not success:
+                self._finish(job_id, JOB_FAILED, "Tasks failed")
+            elif stage + 1 < len(self._stages[kind]):
+                self._update(job_id, status=JOB_QUEUED, stage=stage + 1)
+                self._submit(job_id, kind, url, stage + 1)
+            else:
+                self._finish(job_id, JOB_DONE)
+        except Exception as e:
+            traceback.print_exc()
+            self._finish(job_id, JOB_FAILED, str(e))
+
+    def _finish(self, job_id: str, status: str, error: str | None = None) -> None:
+        try:
+            self._update(job_id, status=status, error=error)
+        except Timeout:
+            # The job is abandoned then, so it's taken over by the next enqueueing once its heartbeat gets old.
+            traceback.print_exc()
+        finally:
+            with self._lock:
+                self._owned_jobs.discard(job_id)
+
+    def _update(self, job_id: str, **fields) -> None:
+        for attempt in range(UPDATE_ATTEMPTS):
+            try:
+                with lock_file_path(self._table_path):
+                    now = time.time()
+                    jobs = self._read_table()
+
+                    if job_id in jobs:
+                        jobs[job_id].update(fields, updated_at=now, heartbeat_at=now)
+                        self._write_table(jobs)
+
+                return
+            except Timeout:
+                if attempt + 1 == UPDATE_ATTEMPTS:
+                    raise
+
+    def _start_heartbeat(self) -> None:
+        if self._heartbeat is not None:
+            return
+
+        self._heartbeat = threading.Thread(target=self._beat, name="job-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def _beat(self) -> None:
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+
+            with self._lock:
+                job_ids = set(self._owned_jobs)
+
+            if not job_ids:
+                continue
+
+            # A failed beat is retried by the next one, the thread must keep running for the jobs not to look abandoned.
+            try:
+                with lock_file_path(self._table_path):
+                    now = time.time()
+                    jobs = self._read_table()
+
+                    for job_id in job_ids & jobs.keys():
+                        jobs[job_id]["heartbeat_at"] = now
+
+                    self._write_table(jobs)
+            except Exception:
+                traceback.print_exc()
+
+    def _read_table(self) -> dict[str, dict]:
+        return read_json_file(self._table_path) or {}
+
+    def _write_table(self, jobs: dict[str, dict]) -> None:
+        finished = [j for j in jobs.values() if j["status"] not in ACTIVE_JOB_STATUSES]
+        finished.sort(key=lambda j: j["updated_at"], reverse=True)
+
+        for job in finished[FINISHED_JOBS_LIMIT:]:
+            del jobs[job["id"]]
+
+        write_json_file(self._table_path, jobs)
+
+
+_job_queue: JobQueue | None = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    global _job_queue
+
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue.from_env()
+
+    return _job_queue
+
+
+def _find_active_job(jobs: dict[str, dict], video_hash: str) -> dict | None:
+    for job in jobs.values():
+        if job["video_hash"] == video_hash and job["status"] in ACTIVE_JOB_STATUSES:
+            return job
+
+    return None
@@ -1,25 +1,56 @@
-import json
 import os
+import re
+from base64 import b64encode
 from datetime import datetime, timedelta, timezone
 from hashlib import md5
 from itertools import islice
+from typing import BinaryIO, Iterator
 from urllib.parse import parse_qs, urlparse
 
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 from plotly.graph_objs import Figure
+from plotly.io.json import to_json_plotly
 from plotly.subplots import make_subplots
 
-from flask_app.services.extension import VodChatFigureUpdater
+from flask_app.services.columnar import read_columns
+from flask_app.services.extension import FigureTracesBuild, VodChatFigureUpdater, VodChatFigureUpdaterV2
 from flask_app.services.utils import (
     IntervalWindow,
+    SecondsHistogram,
+    TimeAxis,
+    align_bins_start,
+    count_timestamps_ranges,
+    downsample_min_max,
+    file_fingerprint,
     humanize_timedelta,
-    normalize_timeline,
+    json_dumps,
+    json_loads,
+    normalize_counts,
+    read_json_file,
+    rolling_sums,
     sort_dict,
     sort_dict_items,
+    sum_binned_counts,
+    to_epoch_seconds,
 )
 
 ANY_EMOTE = 'ANY EMOTE'
+# Typed array types supported by Plotly.js, from the most compact ones
+TYPED_ARRAY_DTYPES = ["u1", "i1", "u2", "i2", "u4", "i4"]
+TIMESTAMPS_COLUMN = "timestamps"
+MESSAGES_HISTOGRAM_COLUMN = "messages"
+EMOTICONS_HISTOGRAM_PREFIX = "emoticons/"
+MESSAGES_SERIES = "messages"
+SPIKES_SERIES = "spikes"
+SPIKES_MIN_MESSAGES = 5
+SPIKES_MIN_POWER = .4
+CUSTOM_EMOTICONS_FILE = "emoticons.txt"
+# The data files being built, e.g. while the chat is downloading, they are kept next to the complete ones
+PARTIAL_FILE_SUFFIX = ".prev"
+
+_custom_emoticons_cache: tuple[tuple[int, int] | None, frozenset[str]] | None = None
 
 
 def url_to_hash(url: str) -> str:
@@ -34,14 +65,179 @@ def hash_to_chat_file(video_hash: str) -> str:
     return f"data/{video_hash}_chat.jsonl"
 
 
+def hash_to_progress_file(video_hash: str) -> str:
+    return f"data/{video_hash}_progress.json"
+
+
+def hash_to_chat_checkpoint_file(video_hash: str) -> str:
+    return f"data/{video_hash}_chat_checkpoint.json"
+
+
 def hash_to_timestamps_file(video_hash: str) -> str:
-    return f"data/{video_hash}_timestamps.json"
+    return f"data/{video_hash}_timestamps.bin"
 
 
 def hash_to_emoticons_file(video_hash: str) -> str:
+    return f"data/{video_hash}_emoticons.bin"
+
+
+def hash_to_histograms_file(video_hash: str) -> str:
+    return f"data/{video_hash}_histograms.bin"
+
+
+def hash_to_legacy_timestamps_file(video_hash: str) -> str:
+    return f"data/{video_hash}_timestamps.json"
+
+
+def hash_to_legacy_emoticons_file(video_hash: str) -> str:
     return f"data/{video_hash}_emoticons.json"
 
 
+def to_partial_file(file_path: str) -> str:
+    return f"{file_path}{PARTIAL_FILE_SUFFIX}"
+
+
+def load_messages_timestamps(video_hash: str, partial: bool = False) -> np.ndarray:
+    """
+    Return the sorted message timestamps (in microseconds) as a read-only memory-mapped array.
+
+    The partial outputs are rewritten while the chat is downloaded, so they are read into memory instead.
+    """
+    data = read_columns(_data_file(hash_to_timestamps_file(video_hash), partial), copy=partial)
+
+    if data is None or TIMESTAMPS_COLUMN not in data:
+        return np.empty(0, dtype=np.int64)
+
+    return data[TIMESTAMPS_COLUMN]
+
+
+def load_emoticons_timestamps(video_hash: str, partial: bool = False) -> dict[str, np.ndarray]:
+    """
+    Return the sorted timestamps (in microseconds) of every emote as read-only memory-mapped arrays, the partial
+    outputs are read into memory.
+    """
+    data = read_columns(_data_file(hash_to_emoticons_file(video_hash), partial), copy=partial)
+
+    if data is None:
+        return {}
+
+    return dict(data.columns)
+
+
+def load_messages_histogram(video_hash: str, partial: bool = False) -> SecondsHistogram:
+    data = read_columns(_data_file(hash_to_histograms_file(video_hash), partial), copy=partial)
+
+    if data is None or MESSAGES_HISTOGRAM_COLUMN not in data:
+        return SecondsHistogram.from_timestamps(load_messages_timestamps(video_hash, partial))
+
+    return SecondsHistogram(data.meta["starts"][MESSAGES_HISTOGRAM_COLUMN], data[MESSAGES_HISTOGRAM_COLUMN])
+
+
+def load_emoticons_histograms(
+        video_hash: str,
+        emoticons_timestamps: dict[str, np.ndarray],
+        partial: bool = False,
+) -> dict[str, SecondsHistogram]:
+    """
+    Return the per-second counts of every emote, the ones missing in the index are counted from the timestamps.
+    """
+    data = read_columns(_data_file(hash_to_histograms_file(video_hash), partial), copy=partial)
+
+    result = {}
+    for emoticon, timestamps in emoticons_timestamps.items():
+        column = EMOTICONS_HISTOGRAM_PREFIX + emoticon
+
+        if data is not None and column in data:
+            result[emoticon] = SecondsHistogram(data.meta["starts"][column], data[column])
+        else:
+            result[emoticon] = SecondsHistogram.from_timestamps(timestamps)
+
+    return result
+
+
+def query_binned_counts(
+        video_hashes: list[str],
+        start: int,
+        end: int,
+        time_step: int,
+        series: list[str],
+) -> dict[str, np.ndarray]:
+    """
+    Count the series in the `time_step` second bins of the `[start, end)` epoch seconds range, summed over the VODs.
+
+    A series is either "messages", "spikes", a rolling window of messages like "60s", or an emote prefixed by
+    "emoticons/".  The counts come from the per-second histograms, the emotes missing there are counted by a binary
+    search over their sorted timestamps, so the cost depends on the number of bins only.
+    """
+    bins = np.arange(start, end, time_step, dtype=np.int64)
+
+    messages_histograms = [load_messages_histogram(video_hash) for video_hash in video_hashes]
+
+    def count_messages(starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+        return sum((h.count_ranges(starts, stops) for h in messages_histograms), np.zeros(len(bins), dtype=np.int64))
+
+    result = {}
+    for name in series:
+        if name == MESSAGES_SERIES:
+            result[name] = count_messages(bins, bins + time_step)
+        elif name == SPIKES_SERIES:
+            previous = count_messages(bins - time_step, bins)
+            result[name] = _calc_spikes_bins(previous, count_messages(bins, bins + time_step))
+        elif name.startswith(EMOTICONS_HISTOGRAM_PREFIX):
+            counts = np.zeros(len(bins), dtype=np.int64)
+            for video_hash in video_hashes:
+                counts += _count_emoticon_ranges(video_hash, name[len(EMOTICONS_HISTOGRAM_PREFIX):], bins, bins + time_step)
+
+            result[name] = counts
+        else:
+            # The same window as `DataFrame.rolling()` has, i.e. the bins ending by the current one
+            try:
+                window = int(pd.Timedelta(name).total_seconds())
+            except ValueError:
+                raise ValueError(f"Unknown series '{name}'")
+            if window <= 0:
+                raise ValueError(f"The window of the series '{name}' should be positive")
+
+            result[name] = count_messages(bins + time_step - window, bins + time_step)
+
+    return result
+
+
+def _count_emoticon_ranges(video_hash: str, emoticon: str, starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+    column = EMOTICONS_HISTOGRAM_PREFIX + emoticon
+
+    data = read_columns(hash_to_histograms_file(video_hash))
+    if data is not None and column in data:
+        return SecondsHistogram(data.meta["starts"][column], data[column]).count_ranges(starts, stops)
+
+    timestamps = load_emoticons_timestamps(video_hash).get(emoticon, np.empty(0, dtype=np.int64))
+
+    return count_timestamps_ranges(timestamps, starts, stops)
+
+
+def _calc_spikes_bins(
+        previous: np.ndarray,
+        current: np.ndarray,
+        min_messages: int | None = SPIKES_MIN_MESSAGES,
+        min_spike_power: float | None = SPIKES_MIN_POWER,
+) -> np.ndarray:
+    # Ignore acceleration loss
+    delta = np.maximum(current - previous, 0)
+
+    if min_messages is not None:
+        delta[current < min_messages] = 0
+
+    if min_spike_power is not None:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            delta[delta / current < min_spike_power] = 0
+
+    return delta
+
+
+def _data_file(file_path: str, partial: bool) -> str:
+    return to_partial_file(file_path) if partial else file_path
+
+
 def parse_vod_url(url: str) -> dict:
     parts = urlparse(url)
     qs = parse_qs(parts.query)
@@ -69,101 +265,155 @@ def parse_vod_url(url: str) -> dict:
     }
 
 
-def truncate_last_second_messages(chat_file_path) -> int | None:
+def truncate_last_second_messages(chat_file_path, checkpoint_file_path=None) -> int | None:
     """
     Remove all messages from the tail of the JSONL file whose have the same second, then return this second value.
+
+    The start of the trailing second is taken from the checkpoint file written while downloading, if it still matches
+    the chat.  Otherwise the file is scanned backwards, and a partially written last line is dropped too.
     """
-    # Inspired by https://stackoverflow.com/a/54278929/3155344
-    with open(chat_file_path, "ab+") as fp:
-        def seek_line_back(count: int = 1) -> int:
-            while count > 0:
-                fp.seek(-2, os.SEEK_CUR)
-                while fp.read(1) != b'\n':
-                    pos = fp.seek(-2, os.SEEK_CUR)
-                    if pos == 0:
-                        return pos
+    with open(chat_file_path, "rb+") as fp:
+        size = fp.seek(0, os.SEEK_END)
+
+        checkpoint = read_json_file(checkpoint_file_path) if checkpoint_file_path else None
+        if checkpoint is not None and _is_checkpoint_valid(fp, size, checkpoint):
+            fp.truncate(checkpoint["offset"])
+            return checkpoint["second"]
+
+        last_line_seconds = None
+        truncate_offset = 0
+
+        for offset, line in _iter_lines_backwards(fp, _find_complete_lines_end(fp, size)):
+            line_seconds = int(json_loads(line)["time_in_seconds"])
 
-                count -= 1
+            if last_line_seconds is None:
+                last_line_seconds = line_seconds
+            elif line_seconds != last_line_seconds:
+                truncate_offset = offset + len(line)
+                break
 
-            return fp.tell()
+        fp.truncate(truncate_offset)
 
-        def read_current_line_json_attr(attr: str):
-            line = fp.readline()
-            line_json = json.loads(line)
-            return line_json[attr]
+        return last_line_seconds
+
+
+def _is_checkpoint_valid(fp: BinaryIO, size: int, checkpoint: dict) -> bool:
+    # The checkpoint must point to a line start of the same chat, at the line of its second.
+    offset = checkpoint.get("offset")
+    if not isinstance(offset, int) or not 0 <= offset < size:
+        return False
+
+    if offset > 0:
+        fp.seek(offset - 1)
+        if fp.read(1) != b"\n":
+            return False
+
+    fp.seek(offset)
+    line = fp.readline()
+    try:
+        return line.endswith(b"\n") and int(json_loads(line)["time_in_seconds"]) == checkpoint.get("second")
+    except (ValueError, KeyError, TypeError):
+        return False
 
-        try:  # catch OSError in case of a one line file
-            seek_line_back(1)
-        except OSError as e:
-            return None
 
-        last_line_seconds = int(read_current_line_json_attr("time_in_seconds"))
+def _find_complete_lines_end(fp: BinaryIO, size: int, block_size: int = 64 * 1024) -> int:
+    # The offset after the last newline, a line without one was being written when the download has crashed.
+    position = size
+    while position > 0:
+        read_size = min(block_size, position)
+        position -= read_size
 
-        while True:
-            pos = seek_line_back(2)
-            line_seconds = int(read_current_line_json_attr("time_in_seconds"))
+        fp.seek(position)
+        newline = fp.read(read_size).rfind(b"\n")
+        if newline >= 0:
+            return position + newline + 1
 
-            if line_seconds != last_line_seconds:
-                # Truncate to the pos because we have moved after the readline().
-                fp.truncate(fp.tell())
-                return last_line_seconds
+    return 0
 
-            if pos == 0:
-                # Truncate to the file beginning because the first line is also at this second.
-                fp.truncate(0)
-                return last_line_seconds
 
+def _iter_lines_backwards(fp: BinaryIO, end: int, block_size: int = 64 * 1024) -> Iterator[tuple[int, bytes]]:
+    """
+    Yield the offsets and the lines before the `end` offset, starting from the last line.
 
-def build_dataframe_by_timestamp(data: list[int], additional_timestamps: list[datetime] | None = None) -> pd.DataFrame:
-    df = pd.DataFrame(data, columns=["timestamp"])
+    The file is read by blocks, so only the current line and a block are kept in memory.
+    """
+    position = end
+    buffer = b""
+
+    while True:
+        # The newline ending the line before the last one of the buffer
+        newline = buffer.rfind(b"\n", 0, len(buffer) - 1)
+
+        if newline >= 0:
+            yield position + newline + 1, buffer[newline + 1:]
+            buffer = buffer[:newline + 1]
+        elif position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+
+            fp.seek(position)
+            buffer = fp.read(read_size) + buffer
+        else:
+            if buffer:
+                yield 0, buffer
+            return
 
-    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True, unit="us")
-    # Assign a message count of 1 for each timestamp
-    df["messages"] = 1
 
-    df.set_index("timestamp", inplace=True)
+def aggregate_messages_series(
+        counts: np.ndarray,
+        time_step: int,
+        rolling_windows: list[IntervalWindow],
+) -> dict[str, np.ndarray]:
+    """
+    The rolling windows and the spikes of the messages timeline, computed in a single pass into one array.
 
-    for timestamp in additional_timestamps or []:
-        if timestamp not in df.index:
-            df.loc[timestamp] = 0
+    The series are the read-only rows of a single `(len(rolling_windows) + 1, len(counts))` array.
+    """
+    series = np.empty((len(rolling_windows) + 1, len(counts)), dtype=np.int64)
+    rolling_sums(counts, time_step, rolling_windows, out=series[:-1])
+    series[-1] = calc_spikes(counts, min_messages=SPIKES_MIN_MESSAGES, min_spike_power=SPIKES_MIN_POWER)
 
-    df.sort_index(inplace=True)
+    series.flags.writeable = False
 
-    return df
+    return {name: series[i] for i, name in enumerate([*rolling_windows, SPIKES_SERIES])}
 
 
 def calc_spikes(
-        df: pd.DataFrame,
+        counts: np.ndarray,
         *,
         min_messages: int | None = None,
         min_spike_power: float | None = None,
-) -> pd.DataFrame:
-    result = df.copy()
-    first_timestamp = result.index[0]
+) -> np.ndarray:
+    # The first bin is compared to an empty one
+    previous = np.empty_like(counts)
+    previous[0:1] = 0
+    previous[1:] = counts[:-1]
 
-    result["delta"] = result["messages"] - result["messages"].shift()
-    result.loc[first_timestamp, "delta"] = result.loc[first_timestamp, "messages"]
+    return _calc_spikes_bins(previous, counts, min_messages, min_spike_power)
 
-    # Ignore acceleration loss
-    result.loc[result["delta"] < 0, "delta"] = 0
 
-    if min_messages is not None:
-        mask = result["messages"] < min_messages
-        result.loc[mask, "delta"] = 0
+def get_custom_emoticons() -> set[str]:
+    """
+    The file is parsed once, then again only after its modification time or size changes.
+    """
+    global _custom_emoticons_cache
 
-    if min_spike_power is not None:
-        mask = result["delta"] / result["messages"] < min_spike_power
-        result.loc[mask, "delta"] = 0
+    fingerprint = file_fingerprint(CUSTOM_EMOTICONS_FILE)
 
-    result["messages"] = result["delta"].astype(int)
-    result.drop(columns=["delta"], inplace=True)
+    cache = _custom_emoticons_cache
+    if cache is None or cache[0] != fingerprint:
+        cache = _custom_emoticons_cache = (fingerprint, frozenset(_read_custom_emoticons()))
 
-    return result
+    return set(cache[1])
 
 
-def get_custom_emoticons() -> set[str]:
+def custom_emoticons_version(custom_emoticons: set[str]) -> str:
+    return md5("\n".join(sorted(custom_emoticons)).encode("utf-8")).hexdigest()
+
+
+def _read_custom_emoticons() -> set[str]:
     try:
-        with open("emoticons.txt", "r") as fp:
+        with open(CUSTOM_EMOTICONS_FILE, "r") as fp:
             emoticons = [line.rstrip() for line in fp]
     except FileNotFoundError:
         emoticons = []
@@ -175,22 +425,71 @@ def get_custom_emoticons() -> set[str]:
     return set(emoticons)
 
 
-def mine_emoticons(message: str, platform_emotes: list[dict], custom_emoticons: set[str]) -> set[str]:
-    emoticons = list(map(lambda x: x["name"], platform_emotes)) + list(custom_emoticons)
+class EmoticonsMatcher:
+    """
+    Find the emotes of chat messages, it's built once per chat to avoid rebuilding the lookups for every message.
+
+    The custom emoticons and the platform emotes of a message are matched by whole words.  YouTube's emotes also have
+    ":shortcut:" aliases, which may be glued to other text, so they are found by a regex scan and counted under the
+    emote name.
+    """
+
+    _shortcut_pattern = re.compile(r":[^\s:]+:")
+
+    def __init__(self, custom_emoticons: set[str]):
+        self._custom_emoticons: frozenset[str] = frozenset(custom_emoticons)
+        # The aliases of every platform emote seen so far, by the emote ID
+        self._platform_aliases: dict[str, tuple[str, ...]] = {}
+
+    def match(self, message: str, platform_emotes: list[dict]) -> set[str]:
+        words = message.split(" ")
+        result = {word for word in words if word in self._custom_emoticons}
+
+        if not platform_emotes:
+            return result
+
+        aliases = {}
+        for emote in platform_emotes:
+            name = emote["name"]
+            for alias in self._get_platform_aliases(emote):
+                aliases[alias] = name
+
+        result.update(aliases[word] for word in words if word in aliases)
 
-    # TODO Use YouTube's "shortcuts" for aliases of an emote
+        if ":" in message:
+            result.update(aliases[s] for s in self._shortcut_pattern.findall(message) if s in aliases)
 
-    return {word for word in message.split(" ") if word in emoticons}
+        return result
+
+    def _get_platform_aliases(self, emote: dict) -> tuple[str, ...]:
+        key = emote.get("id") or emote["name"]
+
+        aliases = self._platform_aliases.get(key)
+        if aliases is None:
+            aliases = (emote["name"], *(emote.get("shortcuts") or []))
+            self._platform_aliases[key] = aliases
+
+        return aliases
 
 
 def count_emoticons_top(
-        emoticons_timestamps: dict[str, list[int]],
+        emoticons_timestamps: dict[str, np.ndarray],
         top_size: int | None = 5,
         min_occurrences: int | None = 5,
 ) -> dict[str, int]:
-    result = {k: len(timestamps) for k, timestamps in emoticons_timestamps.items()}
+    return rank_emoticons_counts(
+        {k: len(timestamps) for k, timestamps in emoticons_timestamps.items()},
+        top_size=top_size,
+        min_occurrences=min_occurrences,
+    )
+
 
-    result = sort_dict(result, values_key=lambda x: x[0], values_reverse=True)
+def rank_emoticons_counts(
+        emoticons_counts: dict[str, int],
+        top_size: int | None = 5,
+        min_occurrences: int | None = 5,
+) -> dict[str, int]:
+    result = sort_dict(emoticons_counts, values_key=lambda x: x[0], values_reverse=True)
 
     if min_occurrences is not None:
         result = {k: v for k, v in result.items() if v >= min_occurrences}
@@ -203,11 +502,15 @@ def count_emoticons_top(
     return result
 
 
-def find_minimal_start_timestamp(messages: list[int], extensions: list[VodChatFigureUpdater]) -> datetime | None:
+def find_minimal_start_timestamp(
+        messages: np.ndarray,
+        extensions: list[VodChatFigureUpdater | VodChatFigureUpdaterV2],
+) -> datetime | None:
     result = None
 
     if len(messages):
-        result = datetime.fromtimestamp(min(messages) / 1_000_000, timezone.utc)
+        # The timestamps are stored sorted.
+        result = datetime.fromtimestamp(int(messages[0]) / 1_000_000, timezone.utc)
 
     for ext in extensions:
         ext_start_timestamp = ext.find_start_timestamp()
@@ -223,65 +526,81 @@ def find_minimal_start_timestamp(messages: list[int], extensions: list[VodChatFi
     return result
 
 
-def build_emoticons_dataframes(
-        emoticons_timestamps: dict[str, list[int]],
+def build_emoticons_series(
+        emoticons_histograms: dict[str, list[SecondsHistogram]],
         time_step: int,
         *,
         forced_start_timestamp: datetime | None = None,
         top_size: int | None = 5,
         min_occurrences: int | None = 5,
         name_filter: list[str] | None = None,
-) -> dict[str, pd.DataFrame]:
-    if not len(emoticons_timestamps):
-        return {}
+) -> tuple[TimeAxis, dict[str, np.ndarray]]:
+    """
+    Re-bin the emoticons onto a shared time axis, a series can be shorter than the axis.
+
+    An emote can have the histograms of several VODs, they are summed after the re-binning, so the gaps between the
+    VODs cost a bin per time step rather than a count per second.
+    """
+    if not len(emoticons_histograms):
+        return TimeAxis(0, time_step, 0), {}
 
     if name_filter is None:
         name_filter = []
 
-    buffer = {k: v for k, v in emoticons_timestamps.items()}
+    buffer = {k: v for k, v in emoticons_histograms.items()}
 
     # Count all emotes
-    buffer[ANY_EMOTE] = [ts for emote_times in buffer.values() for ts in emote_times]
-    buffer[ANY_EMOTE] = sorted(buffer[ANY_EMOTE])
+    buffer[ANY_EMOTE] = [h for histograms in emoticons_histograms.values() for h in histograms]
+
+    totals = {k: sum(h.total for h in v) for k, v in buffer.items()}
 
     # Discard rare emotes
     if min_occurrences is not None:
-        buffer = {k: v for k, v in buffer.items() if len(v) >= min_occurrences}
+        buffer = {k: v for k, v in buffer.items() if totals[k] >= min_occurrences}
     # Filter out by emote name
     if len(name_filter):
         buffer = {k: v for k, v in buffer.items() if k in name_filter}
     # Sort by frequency
-    buffer = sort_dict_items(buffer, key=lambda x: len(x[1]), reverse=True)
+    buffer = sort_dict_items(buffer, key=lambda x: totals[x[0]], reverse=True)
 
-    result = {}
-    additional_timestamps = [forced_start_timestamp] if forced_start_timestamp else None
-    for emote, timestamps in buffer.items():
-        emote_df = build_dataframe_by_timestamp(timestamps, additional_timestamps)
-        emote_df = normalize_timeline(emote_df, time_step)
+    # All the series start by the same bin, so they could share the axis
+    starts = [h.start for histograms in buffer.values() for h in histograms if len(h.counts)]
+    if forced_start_timestamp is not None:
+        starts.append(to_epoch_seconds(forced_start_timestamp))
+
+    if not len(starts):
+        return TimeAxis(0, time_step, 0), {}
 
-        if len(emote_df) > 0:
-            result[emote] = emote_df
+    axis_start = align_bins_start(min(starts), time_step)
+
+    result = {}
+    for emote, histograms in buffer.items():
+        _, bins = sum_binned_counts([normalize_counts(h, time_step) for h in histograms], time_step, axis_start)
+        result[emote] = bins
 
     # Get N-top emotes
     if top_size is not None:
         result = {k: v for k, v in islice(result.items(), top_size)}
 
-    return result
+    axis_length = max(map(len, result.values()), default=0)
+
+    return TimeAxis(axis_start, time_step, axis_length), result
 
 
 def build_multiplot_figure(
-        messages_dfs: dict[IntervalWindow, pd.DataFrame],
-        messages_time_step: int,
-        emoticons_dfs: dict[str, pd.DataFrame],
-        emoticons_time_step: int,
+        messages_axis: TimeAxis,
+        messages_series: dict[IntervalWindow, np.ndarray],
+        emoticons_axis: TimeAxis,
+        emoticons_series: dict[str, np.ndarray],
         xaxis_title: str,
-        extensions: list[VodChatFigureUpdater] | None = None,
+        extensions: list[VodChatFigureUpdater | VodChatFigureUpdaterV2] | None = None,
+        messages_points_budget: int | None = None,
 ) -> Figure:
     if extensions is None:
         extensions = []
 
     messages_row = 1
-    emoticons_row = 2 if len(emoticons_dfs) else 0
+    emoticons_row = 2 if len(emoticons_series) else 0
     total_rows = max(messages_row, emoticons_row)
 
     for ext in extensions:
@@ -291,6 +610,12 @@ def build_multiplot_figure(
 
     total_height, row_heights = _calculate_chart_heights(emoticons_row > 0, extensions)
 
+    # The traces of the v2 extensions are built in the background meanwhile the chat charts are.
+    traces_build = FigureTracesBuild(
+        [ext for ext in extensions if isinstance(ext, VodChatFigureUpdaterV2)],
+        messages_axis.start_timestamp,
+    )
+
     fig = make_subplots(
         rows=total_rows,
         cols=1,
@@ -300,34 +625,43 @@ def build_multiplot_figure(
     )
     fig.update_xaxes(rangeslider=dict(visible=True, thickness=.1), row=total_rows, col=1)
 
-    append_messages_traces(fig, messages_dfs, row=messages_row, col=1, legend="legend1", showonly=["spikes"])
+    append_messages_traces(
+        fig,
+        messages_axis,
+        messages_series,
+        row=messages_row,
+        col=1,
+        legend="legend1",
+        showonly=["spikes"],
+        points_budget=messages_points_budget,
+    )
     fig.update_yaxes(row=messages_row, title="Messages")
 
     if emoticons_row > 0:
-        append_emoticons_traces(fig, emoticons_dfs, emoticons_time_step, row=emoticons_row, col=1, legend="legend2")
+        append_emoticons_traces(fig, emoticons_axis, emoticons_series, row=emoticons_row, col=1, legend="legend2")
         fig.update_yaxes(row=emoticons_row, title="Emoticons")
         fig.update_xaxes(row=emoticons_row, title=xaxis_title)
     else:
         fig.update_xaxes(row=messages_row, title=xaxis_title)
 
+    extensions_traces = traces_build.collect()
+
     for ext in extensions:
-        ext.add_traces(fig, xaxis_title)
+        if isinstance(ext, VodChatFigureUpdaterV2):
+            if ext in extensions_traces:
+                ext.apply_traces(fig, extensions_traces[ext], xaxis_title)
+        else:
+            ext.add_traces(fig, xaxis_title)
 
         # Without these predefined shapes, the dynamic video tracker lines glitch as fuck.
         fig.add_vline(name="video-tracker", x=0, visible=False)
 
-    any_df_key = next(iter(messages_dfs))
-    any_df = messages_dfs[any_df_key]
-    start_timestamp: datetime = any_df["timestamp"][0].to_pydatetime()
-    points_count = len(any_df)
-    min_time_step = min(messages_time_step, emoticons_time_step)
-
     _multiplot_figure_layout(
         fig,
         height=total_height,
-        start_timestamp=start_timestamp,
-        points_count=points_count,
-        time_step=min_time_step,
+        start_timestamp=messages_axis.start_timestamp,
+        points_count=messages_axis.length,
+        time_step=min(messages_axis.time_step, emoticons_axis.time_step),
     )
 
     return fig
@@ -335,7 +669,7 @@ def build_multiplot_figure(
 
 def _calculate_chart_heights(
         with_emoticons_chart: bool,
-        extensions: list[VodChatFigureUpdater],
+        extensions: list[VodChatFigureUpdater | VodChatFigureUpdaterV2],
 ) -> tuple[int, list[float]]:
     subplot_heights = [450]
 
@@ -354,29 +688,31 @@ def _calculate_chart_heights(
 
 def append_messages_traces(
         fig: Figure,
-        messages_dfs: dict[IntervalWindow, pd.DataFrame],
+        axis: TimeAxis,
+        messages_series: dict[IntervalWindow, np.ndarray],
         *,
         row: str | int | None = None,
         col: str | int | None = None,
         showlegend: bool = True,
         legend: str | None = None,
         showonly: list[str] | None = None,
+        points_budget: int | None = None,
 ) -> None:
     if showonly is None:
         showonly = []
 
-    for line_name, df in messages_dfs.items():
-        df["timestamp"] = df.index
-        df["timedelta"] = (df["timestamp"] - df["timestamp"].iloc[0]) // pd.Timedelta("1s")
-        df.set_index("timedelta", inplace=True)
+    for line_name, counts in messages_series.items():
+        x, y = downsample_min_max(axis.offsets, counts, points_budget)
 
         trace = go.Scatter(
             name=line_name,
-            x=df.index,
-            y=df["messages"],
+            x=x,
+            y=y,
             mode="lines",
             showlegend=showlegend,
             legend=legend,
+            # Lets the frontend replace the points by a detailed data of the zoomed range.
+            meta=dict(series=line_name),
         )
 
         if len(showonly) and line_name not in showonly:
@@ -387,33 +723,29 @@ def append_messages_traces(
 
 def append_emoticons_traces(
         fig: Figure,
-        emoticons_dfs: dict[str, pd.DataFrame],
-        time_step: int,
+        axis: TimeAxis,
+        emoticons_series: dict[str, np.ndarray],
         *,
         row: str | int | None = None,
         col: str | int | None = None,
         showlegend: bool = True,
         legend: str | None = None,
 ) -> None:
-    if not len(emoticons_dfs):
+    if not len(emoticons_series):
         return
 
-    for line_name, df in emoticons_dfs.items():
-        df["timestamp"] = df.index
-        df["timedelta"] = (df["timestamp"] - df["timestamp"].iloc[0]) // pd.Timedelta("1s")
-        df.set_index("timedelta", inplace=True)
-
+    for line_name, counts in emoticons_series.items():
         trace = go.Bar(
             name=line_name,
-            x=df.index,
-            y=df["messages"],
-            width=time_step,
+            x=axis.offsets[:len(counts)],
+            y=counts,
+            width=axis.time_step,
             offset=0,
             showlegend=showlegend,
             legend=legend,
         )
 
-        if len(emoticons_dfs) > 1 and line_name == ANY_EMOTE:
+        if len(emoticons_series) > 1 and line_name == ANY_EMOTE:
             trace.update(dict(visible="legendonly"))
 
         fig.add_trace(trace, row=row, col=col)
@@ -441,18 +773,21 @@ def _multiplot_figure_layout(
         barmode="stack",
     )
 
-    xaxis_aliases = _build_time_axis_aliases(start_timestamp, points_count, time_step)
+    tickvals, ticktext = _build_time_axis_ticks(start_timestamp, points_count * time_step, 3600)
+
+    # Tells the frontend where the zero point is, the hovered points are captioned by their video time there.
+    fig.update_layout(meta=dict(time_axis=dict(
+        origin=to_epoch_seconds(start_timestamp),
+    )))
 
     fig.update_xaxes(
         type="linear",
         minallowed=-time_step,
         maxallowed=points_count * time_step,
 
-        tickmode="linear",
-        tick0=0,
-        dtick=3600,
-        labelalias=xaxis_aliases,
-        tickformat="d",
+        tickmode="array",
+        tickvals=tickvals,
+        ticktext=ticktext,
         showgrid=True,
 
         tickfont_size=11,
@@ -483,23 +818,74 @@ def separate_subplot_legends(fig: Figure):
         })
 
 
-def _build_time_axis_aliases(
+def _build_time_axis_ticks(
         start_timestamp: datetime,
-        points_count: int,
-        time_step: int,
-) -> dict[int, str]:
-    result = {}
-    for seconds in range(0, points_count * time_step, time_step):
-        text = short_caption = humanize_timedelta(seconds)
+        total_seconds: int,
+        tick_step: int,
+) -> tuple[list[int], list[str]]:
+    tickvals = list(range(0, total_seconds, tick_step))
+    ticktext = []
+    for seconds in tickvals:
+        point_timestamp = start_timestamp + timedelta(seconds=seconds)
+
+        ticktext.append(
+            f"{humanize_timedelta(seconds)}<br>" +
+            f"{point_timestamp.strftime('%Y-%m-%d')}<br>" +
+            f"{point_timestamp.strftime('%H:%M:%S')}"
+        )
 
-        if seconds % 3600 == 0:
-            point_timestamp = start_timestamp + timedelta(seconds=seconds)
-            text = (
-                    f"{short_caption}<br>" +
-                    f"{point_timestamp.strftime('%Y-%m-%d')}<br>" +
-                    f"{point_timestamp.strftime('%H:%M:%S')}"
-            )
+    return tickvals, ticktext
 
-        result[seconds] = text
 
-    return result
+def serialize_figure(fig: Figure) -> bytes:
+    """
+    Serialize the figure to JSON in one pass, numeric trace data are packed to base64 typed arrays.
+    """
+    fig_dict = fig.to_plotly_json()
+
+    for trace in fig_dict["data"]:
+        for attr in ("x", "y"):
+            if isinstance(trace.get(attr), np.ndarray):
+                trace[attr] = encode_typed_array(trace[attr])
+
+    return to_json_plotly(fig_dict).encode("utf-8")
+
+
+def encode_typed_array(values: np.ndarray) -> dict | np.ndarray:
+    """
+    Pack the array into the Plotly.js typed array spec, using the most compact type that keeps the values intact.
+    """
+    if values.dtype.kind == "f":
+        return _typed_array_spec(values, np.dtype("<f8"))
+
+    if values.dtype.kind not in "iu":
+        return values
+
+    lowest, highest = (int(values.min()), int(values.max())) if len(values) else (0, 0)
+    for dtype in TYPED_ARRAY_DTYPES:
+        dtype = np.dtype(dtype).newbyteorder("<")
+        limits = np.iinfo(dtype)
+
+        if limits.min <= lowest and highest <= limits.max:
+            return _typed_array_spec(values, dtype)
+
+    return values
+
+
+def _typed_array_spec(values: np.ndarray, dtype: np.dtype) -> dict:
+    return dict(
+        dtype=dtype.str[1:],
+        bdata=b64encode(values.astype(dtype).tobytes()).decode("ascii"),
+    )
+
+
+def build_graph_payload(plotly_json: bytes, **metadata) -> bytes:
+    """
+    Splice the metadata around the already serialized figure, so the figure is never parsed back.
+    """
+    metadata_json = json_dumps(metadata)
+
+    if not len(metadata):
+        return b'{"plotly":' + plotly_json + b'}'
+
+    return b'{"plotly":' + plotly_json + b',' + metadata_json[1:]
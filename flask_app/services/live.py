@@ -0,0 +1,257 @@
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Iterable, Iterator
+
+from chat_downloader import ChatDownloader
+
+from flask_app.services.lib import MESSAGES_SERIES, SPIKES_MIN_MESSAGES, SPIKES_MIN_POWER, SPIKES_SERIES
+from flask_app.services.utils import IntervalWindow, json_loads, window_seconds
+
+# A stream without subscribers is stopped after this
+IDLE_TIMEOUT = 60  # In seconds
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+class LiveChatAggregator:
+    """
+    Count the messages of a live chat into time bins, and keep the rolling windows and the spikes of the closed bins.
+
+    Every message costs O(1): the windows are running sums over a ring buffer of the last bins counts.  Only the
+    `history_size` last points are kept, so the memory stays bounded however long the stream is.
+    """
+
+    def __init__(self, time_step: int, windows: list[IntervalWindow], history_size: int):
+        self._time_step: int = time_step
+        self._windows: dict[IntervalWindow, int] = {
+            w: max(window_seconds(w) // time_step, 1) for w in windows
+        }
+
+        self._ring: list[int] = [0] * max(self._windows.values())
+        self._ring_position: int = 0
+        self._sums: dict[IntervalWindow, int] = {w: 0 for w in windows}
+
+        self._current_bin: int | None = None
+        self._current_count: int = 0
+        self._previous_count: int = 0
+
+        self._history: deque[dict] = deque(maxlen=history_size)
+
+    @property
+    def history(self) -> list[dict]:
+        return list(self._history)
+
+    def add_message(self, message: dict) -> list[dict]:
+        """
+        Count the message, then return the points of the bins closed by it.
+        """
+        seconds = message["timestamp"] // 1_000_000
+        message_bin = seconds // self._time_step
+
+        points = []
+        if self._current_bin is None:
+            self._current_bin = message_bin
+        elif message_bin > self._current_bin:
+            # The empty bins of a pause are closed too, but not more of them than the history keeps.
+            skipped_bins = min(message_bin - self._current_bin - 1, self._history.maxlen)
+
+            points.append(self._close_bin())
+            for _ in range(skipped_bins):
+                points.append(self._close_bin())
+
+            self._current_bin = message_bin
+
+        # Late messages of already closed bins are counted into the current one
+        self._current_count += 1
+
+        return points
+
+    def _close_bin(self) -> dict:
+        count = self._current_count
+
+        # Update the windows by the counts entering and leaving them, then replace the oldest count of the ring.
+        ring_size = len(self._ring)
+        for window, bins in self._windows.items():
+            self._sums[window] += count - self._ring[(self._ring_position - bins) % ring_size]
+        self._ring[self._ring_position] = count
+        self._ring_position = (self._ring_position + 1) % ring_size
+
+        point = {
+            "t": self._current_bin * self._time_step,
+            MESSAGES_SERIES: count,
+            **self._sums,
+            SPIKES_SERIES: calc_spike(self._previous_count, count),
+        }
+        self._history.append(point)
+
+        self._previous_count = count
+        self._current_count = 0
+        self._current_bin += 1
+
+        return point
+
+
+def calc_spike(previous: int, current: int) -> int:
+    # The same rules as `calc_spikes()` has, for a single bin
+    delta = max(current - previous, 0)
+
+    if current < SPIKES_MIN_MESSAGES or delta / current < SPIKES_MIN_POWER:
+        return 0
+
+    return delta
+
+
+class LiveChatSession:
+    """
+    Follow a live chat in a background thread and broadcast the closed points to the subscribers.
+
+    The session is stopped by a timer once it has had no subscribers for `IDLE_TIMEOUT`, even if the chat is silent.
+    The messages source gets the stop event, it must return soon after the event is set.
+    """
+
+    def __init__(self, messages_factory: Callable[[threading.Event], Iterable[dict]], aggregator: LiveChatAggregator):
+        self._messages_factory: Callable[[threading.Event], Iterable[dict]] = messages_factory
+        self._aggregator: LiveChatAggregator = aggregator
+
+        self._subscribers: set[queue.Queue] = set()
+        self._lock = threading.Lock()
+        self._idle_timer: threading.Timer | None = None
+        self._stop = threading.Event()
+        self._finished = threading.Event()
+
+        self._thread = threading.Thread(target=self._follow, name="live-chat", daemon=True)
+
+    @property
+    def finished(self) -> bool:
+        return self._finished.is_set() or self._stop.is_set()
+
+    def start(self) -> None:
+        self._thread.start()
+
+        with self._lock:
+            self._start_idle_timer()
+
+    def subscribe(self) -> tuple[queue.Queue, list[dict]]:
+        """
+        Return a queue of the next points (`None` ends the stream), and the points closed so far.
+        """
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+        with self._lock:
+            self._subscribers.add(subscriber)
+            history = self._aggregator.history
+
+            if self._idle_timer is not None:
+                self._idle_timer.cancel()
+                self._idle_timer = None
+
+        return subscriber, history
+
+    def unsubscribe(self, subscriber: queue.Queue) -> None:
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+            if not self._subscribers:
+                self._start_idle_timer()
+
+    def _start_idle_timer(self) -> None:
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+
+        self._idle_timer = threading.Timer(IDLE_TIMEOUT, self._stop_if_idle)
+        self._idle_timer.daemon = True
+        self._idle_timer.start()
+
+    def _stop_if_idle(self) -> None:
+        with self._lock:
+            if not self._subscribers:
+                self._stop.set()
+
+    def _follow(self) -> None:
+        try:
+            for message in self._messages_factory(self._stop):
+                if self._stop.is_set():
+                    break
+
+                with self._lock:
+                    points = self._aggregator.add_message(message)
+
+                    for point in points:
+                        self._publish(point)
+        finally:
+            self._finished.set()
+
+            with self._lock:
+                for subscriber in self._subscribers:
+                    self._publish(None, subscriber)
+
+    def _publish(self, point: dict | None, subscriber: queue.Queue | None = None) -> None:
+        for s in [subscriber] if subscriber is not None else self._subscribers:
+            # A slow subscriber loses the oldest points instead of growing the queue
+            while True:
+                try:
+                    s.put_nowait(point)
+                    break
+                except queue.Full:
+                    try:
+                        s.get_nowait()
+                    except queue.Empty:
+                        pass
+
+
+_live_sessions: dict[str, LiveChatSession] = {}
+_live_sessions_lock = threading.Lock()
+
+
+def get_live_session(key: str, factory: Callable[[], LiveChatSession]) -> LiveChatSession:
+    """
+    Return the running session of the key, or start a new one.
+    """
+    with _live_sessions_lock:
+        session = _live_sessions.get(key)
+
+        if session is None or session.finished:
+            session = _live_sessions[key] = factory()
+            session.start()
+
+    return session
+
+
+def follow_live_chat(url: str, stop: threading.Event | None = None) -> Iterator[dict]:
+    """
+    Yield the messages of a live chat until the `stop` event is set.
+
+    The downloader blocks while waiting for the next message, so a silent chat notices the event with its next message.
+    """
+    stop = stop or threading.Event()
+
+    for message in ChatDownloader().get_chat(url):
+        if stop.is_set():
+            return
+
+        yield message
+
+
+def replay_chat_file(file_path: str, speed: float = 1.0, stop: threading.Event | None = None) -> Iterator[dict]:
+    """
+    Yield the messages of a recorded JSONL chat with the original pauses between them, as a fake live chat.
+
+    The replay ends as soon as the `stop` event is set, even during a pause.
+    """
+    stop = stop or threading.Event()
+    started_at = time.monotonic()
+    first_timestamp = None
+
+    with open(file_path, "rb") as fp:
+        for line in fp:
+            message = json_loads(line)
+
+            if first_timestamp is None:
+                first_timestamp = message["timestamp"]
+
+            delay = (message["timestamp"] - first_timestamp) / 1_000_000 / speed - (time.monotonic() - started_at)
+            if delay > 0 and stop.wait(delay):
+                return
+
+            yield message
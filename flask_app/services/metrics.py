@@ -0,0 +1,161 @@
+import random
+import threading
+import time
+import tracemalloc
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from os import getenv
+
+from flask import Flask, Response, g, has_request_context, request
+
+# Upper bounds of the stage duration buckets, in seconds
+STAGE_SECONDS_BUCKETS = (.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+
+class StageMetrics:
+    """
+    Time the stages of the graph requests, and aggregate the timings into histograms by the endpoint and the stage.
+
+    The stages of a request are reported by its `Server-Timing` header, the histograms by the `/metrics` endpoint in
+    the Prometheus text format.  A sampled request also records the memory peak of every stage by `tracemalloc`: only
+    one request is traced at a time, and its peaks include the allocations of the other threads running meanwhile.
+    """
+
+    def __init__(self, enabled: bool, tracemalloc_rate: float = 0):
+        self._enabled: bool = enabled
+        self._tracemalloc_rate: float = tracemalloc_rate
+
+        # Per the endpoint and the stage: the (non-cumulative) bucket counts, the sum and the count of the timings
+        self._histograms: dict[tuple[str, str], tuple[list[int], float, int]] = {}
+        self._peak_bytes: dict[tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+        self._tracing_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "StageMetrics":
+        return cls(
+            enabled=bool(int(getenv("METRICS_ENABLED", 1))),
+            tracemalloc_rate=float(getenv("METRICS_TRACEMALLOC_RATE", 0)),
+        )
+
+    def init_app(self, app: Flask) -> None:
+        app.add_url_rule("/metrics", "metrics", self._metrics_view)
+
+        if self._enabled:
+            app.before_request(self._start_request)
+            app.after_request(self._finish_request)
+            app.teardown_request(self._stop_tracing)
+
+    def stage(self, name: str) -> AbstractContextManager:
+        if not self._enabled or not has_request_context():
+            return nullcontext()
+
+        return self._measure(name)
+
+    @contextmanager
+    def _measure(self, name: str):
+        traced = g.get("metrics_traced", False)
+        if traced:
+            # The peak is reported above the memory already allocated before the stage
+            tracemalloc.reset_peak()
+            start_bytes = tracemalloc.get_traced_memory()[0]
+
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started_at
+            peak_bytes = tracemalloc.get_traced_memory()[1] - start_bytes if traced else None
+
+            g.setdefault("metrics_stages", []).append((name, elapsed, peak_bytes))
+
+    def _start_request(self) -> None:
+        if self._tracemalloc_rate <= 0 or random.random() >= self._tracemalloc_rate:
+            return
+
+        if not tracemalloc.is_tracing() and self._tracing_lock.acquire(blocking=False):
+            tracemalloc.start()
+            g.metrics_traced = True
+
+    def _finish_request(self, response: Response) -> Response:
+        stages = g.pop("metrics_stages", None)
+        if not stages:
+            return response
+
+        endpoint = request.endpoint or "unknown"
+        with self._lock:
+            for name, elapsed, peak_bytes in stages:
+                self._observe((endpoint, name), elapsed, peak_bytes)
+
+        response.headers["Server-Timing"] = ", ".join(
+            f"{name};dur={elapsed * 1000:.1f}" + (f';desc="peak {peak_bytes / 2 ** 20:.1f}MiB"' if peak_bytes is not None else "")
+            for name, elapsed, peak_bytes in stages
+        )
+
+        return response
+
+    def _stop_tracing(self, exc: BaseException | None = None) -> None:
+        if g.pop("metrics_traced", False):
+            tracemalloc.stop()
+            self._tracing_lock.release()
+
+    def _observe(self, key: tuple[str, str], elapsed: float, peak_bytes: int | None) -> None:
+        buckets, total, count = self._histograms.get(key) or ([0] * (len(STAGE_SECONDS_BUCKETS) + 1), 0.0, 0)
+
+        bucket = next((i for i, bound in enumerate(STAGE_SECONDS_BUCKETS) if elapsed <= bound), -1)
+        buckets[bucket] += 1
+        self._histograms[key] = (buckets, total + elapsed, count + 1)
+
+        if peak_bytes is not None:
+            self._peak_bytes[key] = max(self._peak_bytes.get(key, 0), peak_bytes)
+
+    def render(self) -> str:
+        """
+        The aggregated metrics in the Prometheus text exposition format.
+        """
+        lines = [
+            "# HELP vod_chat_stage_seconds Duration of the graph request stages.",
+            "# TYPE vod_chat_stage_seconds histogram",
+        ]
+
+        with self._lock:
+            histograms = sorted((key, (list(buckets), *rest)) for key, (buckets, *rest) in self._histograms.items())
+            peaks = sorted(self._peak_bytes.items())
+
+        for (endpoint, name), (buckets, total, count) in histograms:
+            labels = f'endpoint="{endpoint}",stage="{name}"'
+
+            cumulative = 0
+            for bound, bucket_count in zip([*map(str, STAGE_SECONDS_BUCKETS), "+Inf"], buckets):
+                cumulative += bucket_count
+                lines.append(f'vod_chat_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+
+            lines.append(f"vod_chat_stage_seconds_sum{{{labels}}} {total}")
+            lines.append(f"vod_chat_stage_seconds_count{{{labels}}} {count}")
+
+        lines += [
+            "# HELP vod_chat_stage_peak_bytes The highest memory peak of the traced graph request stages.",
+            "# TYPE vod_chat_stage_peak_bytes gauge",
+        ]
+        for (endpoint, name), peak_bytes in peaks:
+            lines.append(f'vod_chat_stage_peak_bytes{{endpoint="{endpoint}",stage="{name}"}} {peak_bytes}')
+
+        return "\n".join(lines) + "\n"
+
+    def _metrics_view(self):
+        return Response(self.render(), mimetype="text/plain; version=0.0.4")
+
+
+_stage_metrics: StageMetrics | None = None
+
+
+def get_stage_metrics() -> StageMetrics:
+    global _stage_metrics
+
+    if _stage_metrics is None:
+        _stage_metrics = StageMetrics.from_env()
+
+    return _stage_metrics
+
+
+def measure_stage(name: str) -> AbstractContextManager:
+    return get_stage_metrics().stage(name)
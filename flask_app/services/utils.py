@@ -1,18 +1,171 @@
 import contextlib
 import json
+import os
 import socket
 from collections import defaultdict
 from contextlib import closing
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Callable, TypeVar
 from urllib.parse import urlparse
 
+import numpy as np
 import pandas as pd
 from filelock import FileLock
 
+try:
+    # A faster drop-in codec for the hot paths, it's an optional dependency.
+    from orjson import dumps as json_dumps, loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
 IntervalWindow = TypeVar('IntervalWindow', str, int)
 PlainType = TypeVar('PlainType', str, int, float, bool)
 
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class TimeAxis:
+    """
+    An equally stepped time axis shared by all the series built over it, the first bin starts at the `start` second.
+
+    The offsets (in seconds since the start) are computed once and are read-only, so an axis and its series could be
+    shared between figures as they are.
+    """
+
+    def __init__(self, start: int, time_step: int, length: int):
+        self._start: int = start
+        self._time_step: int = time_step
+        self._length: int = length
+        self._offsets: np.ndarray | None = None
+
+    @property
+    def start(self) -> int:
+        return self._start
+
+    @property
+    def start_timestamp(self) -> datetime:
+        return EPOCH + timedelta(seconds=self._start)
+
+    @property
+    def time_step(self) -> int:
+        return self._time_step
+
+    @property
+    def length(self) -> int:
+        return self._length
+
+    @property
+    def offsets(self) -> np.ndarray:
+        if self._offsets is None:
+            offsets = np.arange(self._length, dtype=np.int64) * self._time_step
+            offsets.flags.writeable = False
+            self._offsets = offsets
+
+        return self._offsets
+
+
+class SecondsHistogram:
+    """
+    Dense message counts per second, the first count belongs to the `start` second (since the Unix epoch).
+    """
+
+    def __init__(self, start: int, counts: np.ndarray):
+        self._start: int = start
+        self._counts: np.ndarray = counts
+        self._prefix_sums: np.ndarray | None = None
+
+    @property
+    def start(self) -> int:
+        return self._start
+
+    @property
+    def counts(self) -> np.ndarray:
+        return self._counts
+
+    @property
+    def total(self) -> int:
+        return int(self._counts.sum())
+
+    @classmethod
+    def from_timestamps(cls, timestamps: np.ndarray) -> "SecondsHistogram":
+        """
+        Count the timestamps given in microseconds.
+        """
+        if not len(timestamps):
+            return cls(0, np.empty(0, dtype=np.int64))
+
+        seconds = np.asarray(timestamps, dtype=np.int64) // 1_000_000
+        start = int(seconds.min())
+
+        return cls(start, np.bincount(seconds - start))
+
+    @classmethod
+    def combine(cls, histograms: list["SecondsHistogram"]) -> "SecondsHistogram":
+        histograms = [h for h in histograms if len(h.counts)]
+
+        if not len(histograms):
+            return cls(0, np.empty(0, dtype=np.int64))
+
+        start = min(h.start for h in histograms)
+        stop = max(h.start + len(h.counts) for h in histograms)
+
+        counts = np.zeros(stop - start, dtype=np.int64)
+        for h in histograms:
+            counts[h.start - start:h.start - start + len(h.counts)] += h.counts
+
+        return cls(start, counts)
+
+    def rebin(self, time_step: int, forced_start: int | None = None) -> tuple[int, np.ndarray]:
+        """
+        Sum the counts into `time_step` second bins, then return the first bin second and the bins.
+
+        The bins are aligned the same way as `DataFrame.resample()` does it by default, i.e. to the midnight of the
+        first day.  The `forced_start` second extends the timeline to the past, if it's earlier than the first count.
+        """
+        first = last = None
+        if len(self._counts):
+            first, last = self._start, self._start + len(self._counts) - 1
+        if forced_start is not None:
+            first = forced_start if first is None else min(first, forced_start)
+            last = forced_start if last is None else max(last, forced_start)
+
+        if first is None:
+            return 0, np.empty(0, dtype=np.int64)
+
+        bins_start = align_bins_start(first, time_step)
+        bins_count = (last - bins_start) // time_step + 1
+
+        padded = np.zeros(bins_count * time_step, dtype=np.int64)
+        offset = self._start - bins_start
+        padded[offset:offset + len(self._counts)] = self._counts
+
+        return bins_start, padded.reshape(bins_count, time_step).sum(axis=1)
+
+    def count_ranges(self, starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+        """
+        Count the messages of every `[start, stop)` seconds range, each range costs O(1) thanks to the prefix sums.
+        """
+        if self._prefix_sums is None:
+            self._prefix_sums = np.concatenate([[0], np.cumsum(self._counts, dtype=np.int64)])
+
+        def prefix_sum(seconds: np.ndarray) -> np.ndarray:
+            return self._prefix_sums[np.clip(np.asarray(seconds) - self._start, 0, len(self._counts))]
+
+        return prefix_sum(stops) - prefix_sum(starts)
+
+
+def count_timestamps_ranges(timestamps: np.ndarray, starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+    """
+    Count the sorted timestamps (in microseconds) of every `[start, stop)` seconds range by a binary search.
+    """
+    starts = np.searchsorted(timestamps, np.asarray(starts, dtype=np.int64) * 1_000_000, side="left")
+    stops = np.searchsorted(timestamps, np.asarray(stops, dtype=np.int64) * 1_000_000, side="left")
+
+    return stops - starts
+
 
 def read_json_file(file_path):
     try:
@@ -22,6 +175,23 @@ def read_json_file(file_path):
         return None
 
 
+def write_json_file(file_path, data) -> None:
+    # Write to a temporary file first, so readers never see a partially written file
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, "wb") as fp:
+        fp.write(json_dumps(data))
+    os.replace(tmp_path, file_path)
+
+
+def file_fingerprint(path: str) -> tuple[int, int] | None:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    return stat.st_mtime_ns, stat.st_size
+
+
 def sort_dict_items(result: dict, **kwargs) -> dict:
     return dict(sorted(result.items(), **kwargs))
 
@@ -90,15 +260,123 @@ def humanize_timedelta(total_seconds: int | timedelta) -> str:
     return f'{sign}{int(hours):02}:{int(minutes):02}:{int(seconds):02}'
 
 
-def normalize_timeline(df: pd.DataFrame, time_step: int) -> pd.DataFrame:
-    # Resample the data into N second bins, filling in any missing seconds with 0
-    return df.resample(f"{time_step}s").sum()
+def to_epoch_seconds(timestamp: datetime) -> int:
+    return (timestamp - EPOCH) // timedelta(seconds=1)
+
+
+def align_bins_start(first_second: int, time_step: int) -> int:
+    # The same alignment as `DataFrame.resample()` does by default, i.e. relatively to the midnight of the first day.
+    day_start = first_second - first_second % 86400
+
+    return day_start + (first_second - day_start) // time_step * time_step
+
+
+def normalize_counts(
+        histogram: SecondsHistogram,
+        time_step: int,
+        forced_start_timestamp: datetime | None = None,
+) -> tuple[TimeAxis, np.ndarray]:
+    # Re-bin the per-second counts into N second bins, filling in any missing seconds with 0
+    forced_start = to_epoch_seconds(forced_start_timestamp) if forced_start_timestamp is not None else None
+
+    bins_start, bins = histogram.rebin(time_step, forced_start)
+
+    return TimeAxis(bins_start, time_step, len(bins)), bins
+
+
+def sum_binned_counts(
+        parts: list[tuple[TimeAxis, np.ndarray]],
+        time_step: int,
+        start: int | None = None,
+) -> tuple[TimeAxis, np.ndarray]:
+    """
+    Sum the bins of several timelines onto a shared grid, the bins of all of them must be aligned the same way.
+
+    The `start` bin extends the grid to the past, the same way as the forced start of `SecondsHistogram.rebin()` does.
+    Every part is added by a single slice, so it costs the sum of the parts sizes (and the gaps between them).
+    """
+    parts = [(axis, bins) for axis, bins in parts if len(bins)]
+
+    if start is None:
+        if not len(parts):
+            return TimeAxis(0, time_step, 0), np.empty(0, dtype=np.int64)
+
+        start = min(axis.start for axis, _ in parts)
+
+    stop = max([axis.start + len(bins) * time_step for axis, bins in parts] + [start + time_step])
+
+    result = np.zeros((stop - start) // time_step, dtype=np.int64)
+    for axis, bins in parts:
+        offset = (axis.start - start) // time_step
+        result[offset:offset + len(bins)] += bins
+
+    return TimeAxis(start, time_step, len(result)), result
+
+
+def window_seconds(window: IntervalWindow) -> int:
+    """
+    The length in seconds of a rolling window given like "60s" or "5min", it must be a positive one.
+    """
+    seconds = int(pd.Timedelta(window).total_seconds())
+    if seconds <= 0:
+        raise ValueError(f"The window '{window}' should be positive")
+
+    return seconds
+
+
+def rolling_sums(
+        counts: np.ndarray,
+        time_step: int,
+        windows: list[IntervalWindow],
+        out: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    The same sums as `DataFrame.rolling(window).sum()` gives for a timeline of `time_step` second bins, i.e. of the
+    bins starting in (t - window, t].
+
+    Every window is a difference of a single cumulative sum of the counts, a row of the result per window.
+    """
+    cumsum = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=cumsum[1:])
+
+    if out is None:
+        out = np.empty((len(windows), len(counts)), dtype=np.int64)
+
+    for i, window in enumerate(windows):
+        # The equal steps put the same number of bins into every window
+        bins = min(-(-window_seconds(window) // time_step), len(counts))
+
+        out[i, :bins] = cumsum[1:bins + 1]
+        np.subtract(cumsum[bins + 1:], cumsum[1:len(counts) + 1 - bins], out=out[i, bins:])
+
+    return out
+
+
+def downsample_min_max(x: np.ndarray, y: np.ndarray, budget: int | None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Reduce a line to about `budget` points, keeping the minimum and the maximum of every bucket of neighbour points.
+
+    Unlike picking every N-th point, it preserves the spikes of the line.
+    """
+    points_count = len(x)
+
+    if budget is None or points_count <= budget:
+        return x, y
+
+    buckets_count = max((budget - 2) // 2, 1)
+    bucket_size = -(-points_count // buckets_count)
+    buckets_count = -(-points_count // bucket_size)
 
+    # Pad the last bucket by its last value, so the buckets could be processed as a matrix.
+    padded = np.concatenate([y, np.repeat(y[-1:], buckets_count * bucket_size - points_count)])
+    padded = padded.reshape(buckets_count, bucket_size)
 
-def make_buckets(df: pd.DataFrame, windows: list[IntervalWindow]) -> dict[IntervalWindow, pd.DataFrame]:
-    result = {}
-    for interval in windows:
-        df_resampled = df.rolling(interval).sum().astype(int)
-        result[interval] = df_resampled
+    offsets = np.arange(buckets_count) * bucket_size
+    indices = np.concatenate([
+        [0, points_count - 1],
+        offsets + padded.argmin(axis=1),
+        offsets + padded.argmax(axis=1),
+    ])
+    indices = np.unique(np.clip(indices, 0, points_count - 1))
 
-    return result
+    return x[indices], y[indices]
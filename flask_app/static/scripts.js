@@ -84,20 +84,31 @@ async function fetchWithTimeout(url, timeout) {
     })
 }
 
-async function fetchUntilData(url, timeout) {
+/**
+ * @param {string} url
+ * @param {number} timeout
+ * @param {function(object): Promise<void>|void} [onPending] Gets the pending response body: the jobs the data are
+ *     waiting for, and the partial data if any
+ * @return {Promise<Response>}
+ */
+async function fetchUntilData(url, timeout, onPending) {
     try {
         const response = await fetchWithTimeout(url, timeout)
 
         if (response.status === 202) {
+            if (onPending) {
+                await onPending(await response.json())
+            }
+
             return new Promise(resolve => {
-                setTimeout(() => resolve(fetchUntilData(url, timeout)), timeout)
+                setTimeout(() => resolve(fetchUntilData(url, timeout, onPending)), timeout)
             })
         }
 
         return response
     } catch (err) {
         if (err.name === "TimeoutError") {
-            return fetchUntilData(url, timeout)
+            return fetchUntilData(url, timeout, onPending)
         }
 
         throw err
@@ -186,3 +197,104 @@ function fillEmoticonsList(nodeId, emoticons, selected) {
         document.querySelector(`#${itemId}`).checked = selected.includes(emote)
     }
 }
+
+/**
+ * @param {number} totalSeconds
+ * @return {string}
+ */
+function humanizeSeconds(totalSeconds) {
+    const sign = totalSeconds < 0 ? '-' : ''
+    totalSeconds = Math.abs(totalSeconds)
+
+    const hours = Math.floor(totalSeconds / 3600)
+    const minutes = Math.floor(totalSeconds % 3600 / 60)
+    const seconds = Math.floor(totalSeconds % 60)
+
+    return sign + [hours, minutes, seconds].map(x => String(x).padStart(2, '0')).join(':')
+}
+
+/**
+ * The time axis is in seconds since the start, so caption the unified hover by the video time of the hovered point.
+ *
+ * @param {HTMLElement} $plot
+ * @return {void}
+ */
+function linkTimeAxisHoverCaption($plot) {
+    if ($plot.dataset.hoverCaptionLinked) {
+        return
+    }
+    $plot.dataset.hoverCaptionLinked = "1"
+
+    // Plotly emits the event after the hover labels are drawn, and doesn't redraw them until other points are hovered.
+    $plot.on("plotly_hover", event => {
+        const $caption = $plot.querySelector(".hoverlayer .legendtitletext")
+
+        if ($caption && event.points.length) {
+            $caption.textContent = humanizeSeconds(event.points[0].x)
+        }
+    })
+}
+
+const TYPED_ARRAYS = {
+    u1: Uint8Array,
+    i1: Int8Array,
+    u2: Uint16Array,
+    i2: Int16Array,
+    u4: Uint32Array,
+    i4: Int32Array,
+    f8: Float64Array,
+}
+
+/**
+ * Unpack the values sent as a Plotly.js typed array spec, the plain arrays are returned as they are.
+ *
+ * @param {object|number[]} values
+ * @return {number[]}
+ */
+function decodeTypedArray(values) {
+    if (!values?.bdata) {
+        return values
+    }
+
+    const bytes = Uint8Array.from(atob(values.bdata), c => c.charCodeAt(0))
+
+    return Array.from(new TYPED_ARRAYS[values.dtype](bytes.buffer))
+}
+
+/**
+ * Replace the points of a line within the X range of the inserted points, the X values of both are sorted.
+ *
+ * @param {number[]} x
+ * @param {number[]} y
+ * @param {number[]} insertedX
+ * @param {number[]} insertedY
+ * @return {number[][]}
+ */
+function splicePoints(x, y, insertedX, insertedY) {
+    const findIndex = predicate => {
+        const index = x.findIndex(predicate)
+        return index === -1 ? x.length : index
+    }
+
+    const before = findIndex(value => value >= insertedX[0])
+    const after = findIndex(value => value > insertedX[insertedX.length - 1])
+
+    return [
+        x.slice(0, before).concat(insertedX, x.slice(after)),
+        y.slice(0, before).concat(insertedY, y.slice(after)),
+    ]
+}
+
+/**
+ * @param {object[]} jobs
+ * @return {string}
+ */
+function describeJobsProgress(jobs) {
+    return jobs
+        .filter(job => job.progress)
+        .map(job => {
+            const time = job.progress.time_in_seconds != null ? `, up to ${humanizeSeconds(job.progress.time_in_seconds)}` : ''
+            return `Downloaded ${job.progress.messages} messages${time}`
+        })
+        .join('; ')
+}
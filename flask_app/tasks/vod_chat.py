@@ -1,19 +1,30 @@
 import json
+import os
 
 import luigi
 from chat_downloader import ChatDownloader
-from luigi.format import UTF8
+from luigi.format import Nop, UTF8
 
+from flask_app.services.columnar import read_columns, read_meta
+from flask_app.services.ingestion import ChatStatsCollector
 from flask_app.services.lib import (
+    TIMESTAMPS_COLUMN,
+    custom_emoticons_version,
     get_custom_emoticons,
+    hash_to_chat_checkpoint_file,
     hash_to_chat_file,
     hash_to_emoticons_file,
+    hash_to_histograms_file,
+    hash_to_legacy_emoticons_file,
+    hash_to_legacy_timestamps_file,
     hash_to_meta_file,
+    hash_to_progress_file,
     hash_to_timestamps_file,
-    mine_emoticons,
+    to_partial_file,
     truncate_last_second_messages,
     url_to_hash,
 )
+from flask_app.services.utils import read_json_file, write_json_file
 
 
 class DumpVodChatMeta(luigi.Task):
@@ -38,7 +49,18 @@ class DumpVodChatMeta(luigi.Task):
 class DownloadVodChat(luigi.Task):
     url = luigi.Parameter()
 
-    old_output = luigi.LocalTarget(format=UTF8, is_tmp=True)
+    # Limits the concurrent downloads across workers, see the `[resources]` section of `luigi.cfg`
+    resources = {"network": 1}
+
+    # Report the progress every N downloaded messages
+    progress_interval = 500
+    # Save the derived data of the chat downloaded so far every N messages
+    flush_interval = 20000
+
+    @property
+    def old_output(self) -> luigi.LocalTarget:
+        # A per-VOD file, so concurrent downloads of different VODs don't share it.
+        return luigi.LocalTarget(to_partial_file(self.output().path), UTF8)
 
     def move_output_for_update(self):
         if self.output().exists():
@@ -54,81 +76,211 @@ class DownloadVodChat(luigi.Task):
         return luigi.LocalTarget(hash_to_chat_file(video_hash), UTF8)
 
     def run(self):
+        video_hash = url_to_hash(str(self.url))
+        # The start of the last downloaded second, it's where an interrupted or updated download continues from
+        checkpoint_file_path = hash_to_chat_checkpoint_file(video_hash)
+
         if self.old_output.exists():
-            truncated_seconds = truncate_last_second_messages(self.old_output.path)
+            truncated_seconds = truncate_last_second_messages(self.old_output.path, checkpoint_file_path)
         else:
             truncated_seconds = None
 
-        chat = ChatDownloader().get_chat(
-            str(self.url),
-            output=self.old_output.path,
-            output_format="jsonl",
-            overwrite=False,
-            start_time=truncated_seconds,
-        )
-        for _ in chat: pass
+        chat = ChatDownloader().get_chat(str(self.url), start_time=truncated_seconds)
 
-        if self.old_output.exists():
-            self.old_output.move(self.output().path, True)
+        # The messages are counted while they arrive, and the partial outputs are saved to where the processing task
+        # resumes from, so the graph of the downloaded part can be shown meanwhile.
+        process_task = ProcessVodChat(self.url)
+        collector = ChatStatsCollector(get_custom_emoticons())
 
+        with open(self.old_output.path, "ab") as fp:
+            # Catch up with the messages downloaded by a previous (interrupted) run.
+            collector.add_chat_file(fp.name, process_task.resume_collector(collector, fp.name), 1)
 
-class CollectVodChatTimestamps(luigi.Task):
-    url = luigi.Parameter()
+            progress_file_path = hash_to_progress_file(video_hash)
+            progress = {"messages": 0, "time_in_seconds": truncated_seconds}
+            for message in chat:
+                # The same format as the JSON lines writer of chat-downloader has
+                line = (json.dumps(message, sort_keys=True) + "\n").encode("utf-8")
+                fp.write(line)
+                collector.add_message(message, len(line))
 
-    def requires(self):
-        return DownloadVodChat(self.url)
+                progress["messages"] += 1
+                progress["time_in_seconds"] = message.get("time_in_seconds")
 
-    def output(self) -> luigi.LocalTarget:
-        url = str(self.url)
-        video_hash = url_to_hash(url)
+                if progress["messages"] % self.progress_interval == 0:
+                    write_json_file(progress_file_path, progress)
+                    self.save_checkpoint(fp, collector, checkpoint_file_path)
 
-        return luigi.LocalTarget(hash_to_timestamps_file(video_hash), UTF8)
+                if progress["messages"] % self.flush_interval == 0:
+                    fp.flush()
+                    process_task.write_outputs(collector, process_task.resume_targets())
 
-    def run(self):
-        messages_timestamps = []
-        with self.input().open("r") as fp:
-            for line in fp:
-                message = json.loads(line)
+            self.save_checkpoint(fp, collector, checkpoint_file_path)
+            process_task.write_outputs(collector, process_task.resume_targets())
 
-                if message["time_in_seconds"] < 0:
-                    continue
+        write_json_file(progress_file_path, progress)
 
-                messages_timestamps.append(message["timestamp"])
+        if self.old_output.exists():
+            self.old_output.move(self.output().path, True)
 
-        with self.output().open("w") as fp:
-            json.dump(messages_timestamps, fp)
+    @staticmethod
+    def save_checkpoint(fp, collector: ChatStatsCollector, checkpoint_file_path: str) -> None:
+        # The chat is flushed first, so the checkpoint never points past the lines written to the file.
+        fp.flush()
+
+        boundary = collector.tail_boundary
+        if boundary is not None:
+            write_json_file(checkpoint_file_path, boundary)
 
 
-class CollectVodChatEmoticons(luigi.Task):
+class ProcessVodChat(luigi.Task):
+    """
+    Scan the chat file once and derive both the timestamps and the emoticons outputs from it.
+
+    On a chat update the previous outputs are kept aside, then only the appended tail of the chat is parsed.
+    """
+
     url = luigi.Parameter()
+    # Processes parsing a huge chat file in parallel, all CPU cores are used by default
+    parse_workers = luigi.IntParameter(default=0, significant=False)
+
+    resources = {"cpu": 1}
+
+    def move_output_for_update(self):
+        for name, target in self.output().items():
+            if target.exists():
+                target.move(self.resume_targets()[name].path)
 
     def requires(self):
         return DownloadVodChat(self.url)
 
-    def output(self) -> luigi.LocalTarget:
+    def complete(self):
+        """
+        The outputs built with other custom emoticons are outdated.
+        """
+        if not super().complete():
+            return False
+
+        meta = read_meta(self.output()["emoticons"].path) or {}
+
+        return meta.get("custom_emoticons_version") == custom_emoticons_version(get_custom_emoticons())
+
+    def output(self) -> dict[str, luigi.LocalTarget]:
         url = str(self.url)
         video_hash = url_to_hash(url)
 
-        return luigi.LocalTarget(hash_to_emoticons_file(video_hash), UTF8)
+        return {
+            "timestamps": luigi.LocalTarget(hash_to_timestamps_file(video_hash), Nop),
+            "emoticons": luigi.LocalTarget(hash_to_emoticons_file(video_hash), Nop),
+            "histograms": luigi.LocalTarget(hash_to_histograms_file(video_hash), Nop),
+        }
 
     def run(self):
-        custom_emoticons = get_custom_emoticons()
+        video_hash = url_to_hash(str(self.url))
+        legacy_file_paths = [hash_to_legacy_timestamps_file(video_hash), hash_to_legacy_emoticons_file(video_hash)]
+
+        collector = ChatStatsCollector(get_custom_emoticons())
 
-        emoticons_timestamps: dict[str, list[int]] = {}
-        with self.input().open("r") as fp:
-            for line in fp:
-                message = json.loads(line)
+        # The outputs are outdated by the custom emoticons only, so they are reused the same way as on a chat update.
+        outputs = self.output()
+        if all(t.exists() for t in outputs.values()) and not any(t.exists() for t in self.resume_targets().values()):
+            self.move_output_for_update()
+
+        # Migrate the data from the legacy JSON files instead of parsing the whole chat again.
+        legacy_messages, legacy_emoticons = map(read_json_file, legacy_file_paths)
+        if legacy_messages is not None and legacy_emoticons is not None:
+            collector.seed(legacy_messages, legacy_emoticons)
+        else:
+            resume_offset = self.resume_collector(collector, self.input().path)
+
+            collector.add_chat_file(self.input().path, resume_offset, self.parse_workers or None)
+
+        self.write_outputs(collector, outputs)
+
+        for legacy_file_path in legacy_file_paths:
+            if os.path.exists(legacy_file_path):
+                os.remove(legacy_file_path)
+
+        for target in self.resume_targets().values():
+            if target.exists():
+                target.remove()
+
+    def resume_targets(self) -> dict[str, luigi.LocalTarget]:
+        """
+        The outputs of the previous run or the partial ones saved while downloading the chat.
+        """
+        return {name: luigi.LocalTarget(to_partial_file(target.path), Nop) for name, target in self.output().items()}
+
+    @staticmethod
+    def write_outputs(collector: ChatStatsCollector, targets: dict[str, luigi.LocalTarget]) -> None:
+        writers = {
+            "timestamps": collector.write_timestamps,
+            "emoticons": collector.write_emoticons,
+            "histograms": collector.write_histograms,
+        }
+
+        # The files are renamed into place only after all of them have been written successfully, they replace the
+        # previous partial outputs if any.
+        tmp_paths = {name: f"{target.path}.tmp-{os.getpid()}" for name, target in targets.items()}
+        try:
+            for name, tmp_path in tmp_paths.items():
+                with open(tmp_path, "wb") as fp:
+                    writers[name](fp)
+
+            for name, tmp_path in tmp_paths.items():
+                os.replace(tmp_path, targets[name].path)
+        finally:
+            for tmp_path in tmp_paths.values():
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def resume_collector(self, collector: ChatStatsCollector, chat_file_path: str) -> int:
+        """
+        Seed the collector from the resume targets, then return the chat file offset to continue from.
+        """
+        targets = self.resume_targets()
+        timestamps = read_columns(targets["timestamps"].path)
+        emoticons = read_columns(targets["emoticons"].path)
+
+        if timestamps is None or emoticons is None:
+            return 0
+
+        checkpoint: dict | None = timestamps.meta.get("checkpoint")
+        if checkpoint is None or timestamps.meta.get("revision") != emoticons.meta.get("revision"):
+            return 0
+
+        previous_custom_emoticons = emoticons.meta.get("custom_emoticons")
+        if previous_custom_emoticons is None:
+            return 0
+
+        # The checkpoint must point to a line start of the same chat file, otherwise the chat was replaced.
+        offset = checkpoint["offset"]
+        with open(chat_file_path, "rb") as fp:
+            if offset > fp.seek(0, os.SEEK_END):
+                return 0
+            if offset > 0:
+                fp.seek(offset - 1)
+                if fp.read(1) != b"\n":
+                    return 0
+
+        resume_offset = collector.resume(timestamps[TIMESTAMPS_COLUMN], emoticons.columns, checkpoint)
+
+        # Only the emoticons added to or removed from the custom ones have to be counted again.
+        changed_emoticons = set(previous_custom_emoticons) ^ collector.custom_emoticons
+        collector.recount_emoticons(chat_file_path, changed_emoticons, resume_offset)
+
+        return resume_offset
+
+
+class CollectVodChatTimestamps(luigi.WrapperTask):
+    url = luigi.Parameter()
 
-                if message["time_in_seconds"] < 0:
-                    continue
+    def requires(self):
+        return ProcessVodChat(self.url)
 
-                message_emotes = mine_emoticons(message["message"], message.get("emotes", []), custom_emoticons)
-                for emoticon in message_emotes:
-                    if emoticon not in emoticons_timestamps:
-                        emoticons_timestamps[emoticon] = []
 
-                    emoticons_timestamps[emoticon].append(message["timestamp"])
+class CollectVodChatEmoticons(luigi.WrapperTask):
+    url = luigi.Parameter()
 
-        if len(emoticons_timestamps):
-            with self.output().open("w") as fp:
-                json.dump(emoticons_timestamps, fp)
+    def requires(self):
+        return ProcessVodChat(self.url)
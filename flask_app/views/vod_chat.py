@@ -1,35 +1,98 @@
 import json
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
 
 import luigi
-import pandas as pd
-from flask import Blueprint, flash, render_template, redirect, request, url_for
-from luigi.task import flatten, flatten_output
-
-from flask_app.services.extension import load_vod_chat_figure_extensions
+import numpy as np
+from flask import Blueprint, current_app, flash, render_template, redirect, request, url_for
+from luigi.execution_summary import LuigiStatusCode
+
+from flask_app.services.cache import COMBINED_LABEL, build_cache_key, get_figure_cache
+from flask_app.services.extension import (
+    figure_extensions_fingerprint,
+    has_missing_traces,
+    load_vod_chat_figure_extensions,
+)
+from flask_app.services.jobs import ACTIVE_JOB_STATUSES, CPU_POOL, NETWORK_POOL, get_job_queue
 from flask_app.services.lib import (
-    build_dataframe_by_timestamp,
-    build_emoticons_dataframes,
+    MESSAGES_SERIES,
+    SPIKES_SERIES,
+    aggregate_messages_series,
+    build_emoticons_series,
+    build_graph_payload,
     build_multiplot_figure,
-    calc_spikes,
     count_emoticons_top,
     find_minimal_start_timestamp,
+    hash_to_chat_file,
     hash_to_emoticons_file,
+    hash_to_histograms_file,
     hash_to_meta_file,
+    hash_to_progress_file,
     hash_to_timestamps_file,
-    normalize_timeline,
+    load_emoticons_histograms,
+    load_emoticons_timestamps,
+    load_messages_histogram,
+    load_messages_timestamps,
     parse_vod_url,
+    query_binned_counts,
+    rank_emoticons_counts,
+    serialize_figure,
+    to_partial_file,
     url_to_hash,
 )
-from flask_app.services.utils import is_http_url, make_buckets, read_json_file
+from flask_app.services.live import (
+    LiveChatAggregator,
+    LiveChatSession,
+    follow_live_chat,
+    get_live_session,
+    replay_chat_file,
+)
+from flask_app.services.metrics import measure_stage
+from flask_app.services.utils import (
+    SecondsHistogram,
+    downsample_min_max,
+    file_fingerprint,
+    is_http_url,
+    json_dumps,
+    normalize_counts,
+    read_json_file,
+    sum_binned_counts,
+)
 from flask_app.tasks.vod_chat import (
     CollectVodChatEmoticons,
     CollectVodChatTimestamps,
     DownloadVodChat,
-    DumpVodChatMeta,
+    ProcessVodChat,
 )
 
 vod_chat_bp = Blueprint("vod_chat", __name__)
 
+MESSAGES_TIME_STEP = 15  # In seconds
+ROLLING_WINDOWS = [f"{1 * MESSAGES_TIME_STEP}s", f"{4 * MESSAGES_TIME_STEP}s", f"{20 * MESSAGES_TIME_STEP}s"]
+EMOTICONS_TIME_STEP = MESSAGES_TIME_STEP * 4
+EMOTICONS_MIN_OCCURRENCES = 10
+EMOTICONS_TOP_SIZE = 6
+# The maximum points of a messages line, the detailed data of a zoomed range are loaded separately
+MESSAGES_POINTS_BUDGET = 2000
+QUERY_MAX_BINS = 100_000
+COMBINED_MAX_WORKERS = 4
+# The points of the live graph, for the last 4 hours
+LIVE_HISTORY_SIZE = 4 * 3600 // MESSAGES_TIME_STEP
+LIVE_KEEP_ALIVE_INTERVAL = 15  # In seconds
+
+DOWNLOAD_JOB = "download"
+UPDATE_JOB = "update"
+
+GRAPH_CONSTANTS = [
+    MESSAGES_TIME_STEP,
+    ROLLING_WINDOWS,
+    EMOTICONS_TIME_STEP,
+    EMOTICONS_MIN_OCCURRENCES,
+    EMOTICONS_TOP_SIZE,
+    MESSAGES_POINTS_BUDGET,
+]
+
 
 @vod_chat_bp.route("/")
 def index():
@@ -48,15 +111,13 @@ def start_download():
         flash("Wrong URLs provided", "error")
         return redirect(url_for(".index"))
 
-    tasks = []
     hashes = []
     for url in sorted(urls):
         video_hash = url_to_hash(url)
         hashes.append(video_hash)
 
-        tasks.append(DumpVodChatMeta(url))
-
-    luigi.build(tasks, workers=1)
+        # The metadata are written by the first stage of the job, as the chat download requires them.
+        get_job_queue().enqueue(DOWNLOAD_JOB, video_hash, url)
 
     hashes_string = ",".join(hashes)
 
@@ -65,31 +126,21 @@ def start_download():
 
 @vod_chat_bp.route("/update_vod_chat/<video_hash>", methods=["POST"])
 def update_vod_chat(video_hash):
-    meta = read_json_file(hash_to_meta_file(video_hash)) or {}
+    url = _read_vod_url(video_hash)
 
-    download_task = DownloadVodChat(url=meta["url"])
-    download_task.move_output_for_update()
+    job = get_job_queue().enqueue(UPDATE_JOB, video_hash, url)
 
-    tasks_to_cleanup = [
-        CollectVodChatTimestamps(url=meta["url"]),
-        CollectVodChatEmoticons(url=meta["url"]),
-    ]
-    outputs_to_cleanup = [flatten_output(task) for task in tasks_to_cleanup]
-    outputs_to_cleanup = flatten(outputs_to_cleanup)
+    return _jobs_response([job])
 
-    for output in outputs_to_cleanup:
-        if output.exists():
-            output.remove()
 
-    tasks = [
-        download_task,
-        CollectVodChatTimestamps(url=meta["url"]),
-        CollectVodChatEmoticons(url=meta["url"]),
-    ]
+@vod_chat_bp.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = get_job_queue().get(job_id)
 
-    luigi.build(tasks, workers=1)
+    if job is None:
+        return json.dumps({'success': False}), 404, {"Content-Type": "application/json"}
 
-    return json.dumps({'success': True}), 202, {"Content-Type": "application/json"}
+    return _json_response(json_dumps(_describe_job(job)))
 
 
 @vod_chat_bp.route("/display_graph/<video_hashes>", methods=["GET"])
@@ -98,13 +149,14 @@ def display_graph(video_hashes):
 
     vods = {}
     for i, video_hash in enumerate(video_hashes, start=1):
-        meta = read_json_file(hash_to_meta_file(video_hash)) or {}
-        vod_data = parse_vod_url(meta["url"])
+        url = _read_vod_url(video_hash)
+        vod_data = parse_vod_url(url)
 
         vods[f"vod{i:02d}"] = dict(
             hash=video_hash,
             data_url=url_for(".calc_vod_graph", video_hash=video_hash),
             update_url=url_for(".update_vod_chat", video_hash=video_hash),
+            live_url=url_for(".display_live", video_hash=video_hash),
             **vod_data,
         )
 
@@ -118,68 +170,112 @@ def display_graph(video_hashes):
     return render_template("vod_chat/graph.html", vods=vods)
 
 
-@vod_chat_bp.route("/calc_vod_graph/<video_hash>", methods=["GET"])
-def calc_vod_graph(video_hash):
-    meta = read_json_file(hash_to_meta_file(video_hash)) or {}
-
-    tasks = [
-        CollectVodChatTimestamps(url=meta["url"]),
-        CollectVodChatEmoticons(url=meta["url"]),
-    ]
-
-    if any(filter(lambda x: not x.complete(), tasks)):
-        luigi.build(tasks, workers=1)
-        return json.dumps({'success': True}), 202, {"Content-Type": "application/json"}
+@vod_chat_bp.route("/display_live/<video_hash>", methods=["GET"])
+def display_live(video_hash):
+    """
+    Follow a live chat, the `replay` argument replays the downloaded chat at the given speed instead.
+    """
+    url = _read_vod_url(video_hash)
 
-    messages_time_step = 15  # In seconds
-    rolling_windows = [f"{1 * messages_time_step}s", f"{4 * messages_time_step}s", f"{20 * messages_time_step}s"]
-    emoticons_time_step = messages_time_step * 4
-    emoticons_min_occurrences = 10
-    emoticons_top_size = 6
+    return render_template(
+        "vod_chat/live.html",
+        url=url,
+        events_url=url_for(".live_events", video_hash=video_hash, **request.args),
+        series=[*ROLLING_WINDOWS, SPIKES_SERIES],
+        max_points=LIVE_HISTORY_SIZE,
+    )
 
-    emoticons_filter = request.args.getlist(f"emoticons[]")
 
-    vod_data = parse_vod_url(meta["url"])
+@vod_chat_bp.route("/live_events/<video_hash>", methods=["GET"])
+def live_events(video_hash):
+    """
+    Server-Sent Events of the live graph: a snapshot of the points so far, then every next point.
+    """
+    url = _read_vod_url(video_hash)
+    replay_speed = request.args.get("replay", type=float)
+
+    if replay_speed:
+        chat_file_path = hash_to_chat_file(video_hash)
+        if not os.path.exists(chat_file_path):
+            return json.dumps({'success': False}), 404, {"Content-Type": "application/json"}
+
+        session_key = f"{video_hash}:replay"
+        messages_factory = lambda stop: replay_chat_file(chat_file_path, replay_speed, stop)
+    else:
+        session_key = video_hash
+        messages_factory = lambda stop: follow_live_chat(url, stop)
+
+    session = get_live_session(session_key, lambda: LiveChatSession(
+        messages_factory,
+        LiveChatAggregator(MESSAGES_TIME_STEP, ROLLING_WINDOWS, LIVE_HISTORY_SIZE),
+    ))
+    subscriber, history = session.subscribe()
+
+    def stream():
+        try:
+            yield _format_sse("snapshot", history)
+
+            while True:
+                try:
+                    point = subscriber.get(timeout=LIVE_KEEP_ALIVE_INTERVAL)
+                except queue.Empty:
+                    if session.finished:
+                        point = None
+                    else:
+                        yield ": keep-alive\n\n"
+                        continue
+
+                if point is None:
+                    yield _format_sse("end", {})
+                    return
+
+                yield _format_sse("point", point)
+        finally:
+            session.unsubscribe(subscriber)
+
+    return current_app.response_class(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    messages: list[int] = read_json_file(hash_to_timestamps_file(video_hash)) or []
-    emoticons: dict[str, list[int]] = read_json_file(hash_to_emoticons_file(video_hash)) or {}
 
-    extensions = load_vod_chat_figure_extensions(messages, emoticons, vod_data)
-    common_start_timestamp = find_minimal_start_timestamp(messages, extensions)
+@vod_chat_bp.route("/calc_vod_graph/<video_hash>", methods=["GET"])
+def calc_vod_graph(video_hash):
+    url = _read_vod_url(video_hash)
 
-    messages_df = build_dataframe_by_timestamp(messages, [common_start_timestamp])
-    messages_df = normalize_timeline(messages_df, messages_time_step)
-    rolling_messages_dfs = make_buckets(messages_df, rolling_windows)
-    rolling_messages_dfs["spikes"] = calc_spikes(messages_df, min_messages=5, min_spike_power=.4)
+    emoticons_filter = request.args.getlist(f"emoticons[]")
 
-    emoticons_top = count_emoticons_top(emoticons, top_size=None, min_occurrences=emoticons_min_occurrences)
-    emoticons_dfs = build_emoticons_dataframes(
-        emoticons,
-        emoticons_time_step,
-        forced_start_timestamp=common_start_timestamp,
-        top_size=emoticons_top_size,
-        min_occurrences=emoticons_min_occurrences,
-        name_filter=emoticons_filter,
+    job = _ensure_vod_chat_processed(video_hash, url)
+    if job is not None:
+        # Show the graph of the chat downloaded so far, the page keeps polling until the job finishes.
+        if not os.path.exists(to_partial_file(hash_to_timestamps_file(video_hash))):
+            return _jobs_response([job])
+
+        payload, _ = _build_vod_graph_payload(video_hash, url, emoticons_filter, partial=True, jobs=[job])
+        return current_app.response_class(payload, status=202, mimetype="application/json")
+
+    figure_cache = get_figure_cache()
+    cache_key = build_cache_key(
+        video_hash,
+        emoticons_filter,
+        _is_dark_theme_request(),
+        GRAPH_CONSTANTS,
+        figure_extensions_fingerprint(),
+        _vod_data_fingerprints(video_hash),
     )
 
-    fig = build_multiplot_figure(
-        rolling_messages_dfs,
-        messages_time_step,
-        emoticons_dfs,
-        emoticons_time_step,
-        "Video time (in minutes)",
-        extensions,
-    )
+    with measure_stage("cache"):
+        payload = figure_cache.get(video_hash, cache_key)
+    if payload is not None:
+        return _json_response(payload)
 
-    if _is_dark_theme_request():
-        fig.update_layout(template="plotly_dark")
+    payload, complete = _build_vod_graph_payload(video_hash, url, emoticons_filter)
+    # A figure without the traces of some extensions is built again by the next request.
+    if complete:
+        figure_cache.put(video_hash, cache_key, payload)
 
-    return dict(
-        plotly=json.loads(fig.to_json()),
-        emoticons_top=list(emoticons_top.items()),
-        selected_emoticons=list(emoticons_dfs.keys()),
-        **vod_data,
-    )
+    return _json_response(payload)
 
 
 @vod_chat_bp.route("/calc_combined_vod_graph/<video_hashes>", methods=["GET"])
@@ -189,89 +285,374 @@ def calc_combined_vod_graph(video_hashes):
     if len(video_hashes) == 1:
         return {}
 
-    tasks = []
+    jobs = []
     for video_hash in video_hashes:
-        meta = read_json_file(hash_to_meta_file(video_hash)) or {}
-        tasks.extend([
-            CollectVodChatTimestamps(url=meta["url"]),
-            CollectVodChatEmoticons(url=meta["url"]),
-        ])
-
-    if any(filter(lambda x: not x.complete(), tasks)):
-        luigi.build(tasks, workers=1)
-        return json.dumps({'success': True}), 202, {"Content-Type": "application/json"}
-
-    messages_time_step = 15  # In seconds
-    rolling_windows = [f"{1 * messages_time_step}s", f"{4 * messages_time_step}s", f"{20 * messages_time_step}s"]
-    emoticons_time_step = messages_time_step * 4
-    emoticons_min_occurrences = 10
-    emoticons_top_size = 6
-
-    combined_messages_df: pd.DataFrame | None = None
-    combined_emoticons: dict[str, list[int]] = {}
-
-    min_start_timestamp = None
-    for video_hash in video_hashes:
-        meta = read_json_file(hash_to_meta_file(video_hash)) or {}
-        vod_data = parse_vod_url(meta["url"])
+        url = _read_vod_url(video_hash)
 
-        messages: list[int] = read_json_file(hash_to_timestamps_file(video_hash)) or []
-        emoticons: dict[str, list[int]] = read_json_file(hash_to_emoticons_file(video_hash)) or {}
+        job = _ensure_vod_chat_processed(video_hash, url)
+        if job is not None:
+            jobs.append(job)
 
-        extensions = load_vod_chat_figure_extensions(messages, emoticons, vod_data)
-        common_start_timestamp = find_minimal_start_timestamp(messages, extensions)
-        min_start_timestamp = common_start_timestamp if min_start_timestamp is None \
-            else min(min_start_timestamp, common_start_timestamp)
+    if jobs:
+        return _jobs_response(jobs)
+
+    emoticons_filter = request.args.getlist(f"emoticons[]")
+
+    figure_cache = get_figure_cache()
+    cache_key = build_cache_key(
+        video_hashes,
+        emoticons_filter,
+        _is_dark_theme_request(),
+        GRAPH_CONSTANTS,
+        figure_extensions_fingerprint(),
+        [_vod_data_fingerprints(video_hash) for video_hash in video_hashes],
+    )
 
-        messages_df = build_dataframe_by_timestamp(messages, [common_start_timestamp])
-        messages_df = normalize_timeline(messages_df, messages_time_step)
+    with measure_stage("cache"):
+        payload = figure_cache.get(COMBINED_LABEL, cache_key)
+    if payload is not None:
+        return _json_response(payload)
+
+    # The VODs are loaded in parallel, then summed on the shared grids of the bins
+    # The extensions of every VOD are loaded by its part, together with its data files
+    with measure_stage("load"):
+        with ThreadPoolExecutor(max_workers=min(len(video_hashes), COMBINED_MAX_WORKERS)) as executor:
+            parts = list(executor.map(_load_combined_vod_part, video_hashes))
+
+    min_start_timestamp = min(filter(None, [part["start_timestamp"] for part in parts]), default=None)
+
+    with measure_stage("messages"):
+        messages_axis, messages_counts = sum_binned_counts([part["messages"] for part in parts], MESSAGES_TIME_STEP)
+        messages_series = aggregate_messages_series(messages_counts, MESSAGES_TIME_STEP, ROLLING_WINDOWS)
+
+    with measure_stage("emoticons"):
+        combined_emoticons_counts: dict[str, int] = {}
+        combined_emoticons_histograms: dict[str, list[SecondsHistogram]] = {}
+        for part in parts:
+            for emote, count in part["emoticons_counts"].items():
+                combined_emoticons_counts[emote] = combined_emoticons_counts.get(emote, 0) + count
+
+            for emote, histogram in part["emoticons_histograms"].items():
+                combined_emoticons_histograms.setdefault(emote, []).append(histogram)
+
+        emoticons_top = rank_emoticons_counts(
+            combined_emoticons_counts,
+            top_size=None,
+            min_occurrences=EMOTICONS_MIN_OCCURRENCES,
+        )
+        emoticons_axis, emoticons_series = build_emoticons_series(
+            combined_emoticons_histograms,
+            EMOTICONS_TIME_STEP,
+            forced_start_timestamp=min_start_timestamp,
+            top_size=EMOTICONS_TOP_SIZE,
+            min_occurrences=EMOTICONS_MIN_OCCURRENCES,
+            name_filter=emoticons_filter,
+        )
 
-        combined_messages_df = messages_df.copy() if combined_messages_df is None \
-            else combined_messages_df.add(messages_df, fill_value=0)
+    with measure_stage("figure"):
+        fig = build_multiplot_figure(
+            messages_axis,
+            messages_series,
+            emoticons_axis,
+            emoticons_series,
+            "Stream time (in minutes)",
+            messages_points_budget=MESSAGES_POINTS_BUDGET,
+        )
 
-        for emote, timestamps in emoticons.items():
-            if emote not in combined_emoticons:
-                combined_emoticons[emote] = timestamps
-            else:
-                combined_emoticons[emote].extend(timestamps)
+        if _is_dark_theme_request():
+            fig.update_layout(template="plotly_dark")
 
-    emoticons_filter = request.args.getlist(f"emoticons[]")
+    with measure_stage("serialize"):
+        payload = build_graph_payload(
+            serialize_figure(fig),
+            emoticons_top=list(emoticons_top.items()),
+            selected_emoticons=list(emoticons_series.keys()),
+            detail_url=url_for(".calc_vod_graph_detail", video_hashes=",".join(video_hashes)),
+        )
+    figure_cache.put(COMBINED_LABEL, cache_key, payload)
 
-    messages_df = normalize_timeline(combined_messages_df, messages_time_step)
-    rolling_messages_dfs = make_buckets(messages_df, rolling_windows)
-    rolling_messages_dfs["spikes"] = calc_spikes(messages_df, min_messages=5, min_spike_power=.4)
+    return _json_response(payload)
 
-    emoticons_top = count_emoticons_top(
-        combined_emoticons,
-        top_size=None,
-        min_occurrences=emoticons_min_occurrences,
-    )
-    emoticons_dfs = build_emoticons_dataframes(
-        combined_emoticons,
-        emoticons_time_step,
-        forced_start_timestamp=min_start_timestamp,
-        top_size=emoticons_top_size,
-        min_occurrences=emoticons_min_occurrences,
-        name_filter=emoticons_filter,
-    )
 
-    fig = build_multiplot_figure(
-        rolling_messages_dfs,
-        messages_time_step,
-        emoticons_dfs,
-        emoticons_time_step,
-        "Stream time (in minutes)",
+@vod_chat_bp.route("/calc_vod_graph_detail/<video_hashes>", methods=["GET"])
+def calc_vod_graph_detail(video_hashes):
+    """
+    Return the messages lines of the zoomed time range, the `origin` is an epoch second of the graph's zero point.
+    """
+    video_hashes = video_hashes.split(",")
+
+    origin = request.args.get("origin", type=int)
+    start = request.args.get("start", 0, type=float)
+    end = request.args.get("end", type=float)
+
+    if origin is None or end is None:
+        return json.dumps({'success': False}), 400, {"Content-Type": "application/json"}
+
+    data_stop = max(h.start + len(h.counts) for h in map(load_messages_histogram, video_hashes))
+
+    # Keep the neighbour points, so the line doesn't break at the range borders.
+    first_bin = max(int(start) // MESSAGES_TIME_STEP - 1, 0)
+    last_bin = min(int(end) // MESSAGES_TIME_STEP + 1, (data_stop - 1 - origin) // MESSAGES_TIME_STEP)
+
+    series_names = [*ROLLING_WINDOWS, SPIKES_SERIES]
+    series = query_binned_counts(
+        video_hashes,
+        origin + first_bin * MESSAGES_TIME_STEP,
+        origin + (last_bin + 1) * MESSAGES_TIME_STEP,
+        MESSAGES_TIME_STEP,
+        series_names,
     )
 
-    if _is_dark_theme_request():
-        fig.update_layout(template="plotly_dark")
+    x = np.arange(first_bin, last_bin + 1) * MESSAGES_TIME_STEP
+
+    traces = []
+    for line_name in series_names:
+        line_x, line_y = downsample_min_max(x, series[line_name], MESSAGES_POINTS_BUDGET)
+        traces.append(dict(name=line_name, x=line_x.tolist(), y=line_y.tolist()))
+
+    return _json_response(json_dumps(dict(traces=traces)))
+
+
+@vod_chat_bp.route("/query_vod_chat/<video_hashes>", methods=["GET"])
+def query_vod_chat(video_hashes):
+    """
+    Return the binned counts of the requested series for the `[start, end)` range given in epoch seconds.
+    """
+    video_hashes = video_hashes.split(",")
+
+    start = request.args.get("start", type=int)
+    end = request.args.get("end", type=int)
+    step = request.args.get("step", MESSAGES_TIME_STEP, type=int)
+    series_names = request.args.getlist("series[]") or [MESSAGES_SERIES]
+
+    if start is None or end is None or step <= 0 or end <= start or (end - start) // step > QUERY_MAX_BINS:
+        return json.dumps({'success': False}), 400, {"Content-Type": "application/json"}
+
+    for video_hash in video_hashes:
+        if not os.path.exists(hash_to_timestamps_file(video_hash)):
+            return json.dumps({'success': False}), 404, {"Content-Type": "application/json"}
+
+    try:
+        series = query_binned_counts(video_hashes, start, end, step, series_names)
+    except ValueError as e:
+        return json.dumps({'success': False, 'error': str(e)}), 400, {"Content-Type": "application/json"}
+
+    return _json_response(json_dumps(dict(
+        start=start,
+        step=step,
+        series={name: counts.tolist() for name, counts in series.items()},
+    )))
+
+
+def _load_combined_vod_part(video_hash: str) -> dict:
+    url = _read_vod_url(video_hash)
+    vod_data = parse_vod_url(url)
+
+    messages = load_messages_timestamps(video_hash)
+    emoticons = load_emoticons_timestamps(video_hash)
+    messages_histogram = load_messages_histogram(video_hash)
+    emoticons_histograms = load_emoticons_histograms(video_hash, emoticons)
+
+    extensions = load_vod_chat_figure_extensions(messages, emoticons, vod_data, dict(
+        messages_histogram=lambda: messages_histogram,
+        emoticons_histograms=lambda: emoticons_histograms,
+    ))
+    start_timestamp = find_minimal_start_timestamp(messages, extensions)
 
     return dict(
-        plotly=json.loads(fig.to_json()),
-        emoticons_top=list(emoticons_top.items()),
-        selected_emoticons=list(emoticons_dfs.keys()),
+        start_timestamp=start_timestamp,
+        messages=normalize_counts(messages_histogram, MESSAGES_TIME_STEP, start_timestamp),
+        emoticons_histograms=emoticons_histograms,
+        # Only the totals are needed for the top, so the timestamps are never merged
+        emoticons_counts={emote: len(timestamps) for emote, timestamps in emoticons.items()},
     )
 
 
+def _build_vod_graph_payload(
+        video_hash: str,
+        url: str,
+        emoticons_filter: list[str],
+        partial: bool = False,
+        jobs: list[dict] | None = None,
+) -> tuple[bytes, bool]:
+    """
+    Return the graph payload, and whether it has the traces of all the figure extensions.
+    """
+    vod_data = parse_vod_url(url)
+
+    with measure_stage("load"):
+        messages = load_messages_timestamps(video_hash, partial)
+        emoticons = load_emoticons_timestamps(video_hash, partial)
+        messages_histogram = load_messages_histogram(video_hash, partial)
+        emoticons_histograms = load_emoticons_histograms(video_hash, emoticons, partial)
+
+    with measure_stage("extensions"):
+        extensions = load_vod_chat_figure_extensions(messages, emoticons, vod_data, dict(
+            messages_histogram=lambda: messages_histogram,
+            emoticons_histograms=lambda: emoticons_histograms,
+        ))
+        common_start_timestamp = find_minimal_start_timestamp(messages, extensions)
+
+    with measure_stage("messages"):
+        messages_axis, messages_counts = normalize_counts(messages_histogram, MESSAGES_TIME_STEP, common_start_timestamp)
+        messages_series = aggregate_messages_series(messages_counts, MESSAGES_TIME_STEP, ROLLING_WINDOWS)
+
+    with measure_stage("emoticons"):
+        emoticons_top = count_emoticons_top(emoticons, top_size=None, min_occurrences=EMOTICONS_MIN_OCCURRENCES)
+        emoticons_axis, emoticons_series = build_emoticons_series(
+            {emote: [histogram] for emote, histogram in emoticons_histograms.items()},
+            EMOTICONS_TIME_STEP,
+            forced_start_timestamp=common_start_timestamp,
+            top_size=EMOTICONS_TOP_SIZE,
+            min_occurrences=EMOTICONS_MIN_OCCURRENCES,
+            name_filter=emoticons_filter,
+        )
+
+    with measure_stage("figure"):
+        fig = build_multiplot_figure(
+            messages_axis,
+            messages_series,
+            emoticons_axis,
+            emoticons_series,
+            "Video time (in minutes)",
+            extensions,
+            messages_points_budget=MESSAGES_POINTS_BUDGET,
+        )
+
+        if _is_dark_theme_request():
+            fig.update_layout(template="plotly_dark")
+
+    metadata = {}
+    if partial:
+        # The detailed data are served from the complete outputs only
+        metadata.update(partial=True, jobs=[_describe_job(job) for job in jobs or []])
+    else:
+        metadata.update(detail_url=url_for(".calc_vod_graph_detail", video_hashes=video_hash))
+
+    with measure_stage("serialize"):
+        payload = build_graph_payload(
+            serialize_figure(fig),
+            emoticons_top=list(emoticons_top.items()),
+            selected_emoticons=list(emoticons_series.keys()),
+            **metadata,
+            **vod_data,
+        )
+
+    return payload, not has_missing_traces(extensions)
+
+
+def _read_vod_url(video_hash: str) -> str:
+    """
+    The URL of the VOD, it's taken from the queued download job until the job writes the metadata.
+    """
+    meta = read_json_file(hash_to_meta_file(video_hash))
+    if meta is not None:
+        return meta["url"]
+
+    job = get_job_queue().find_active(video_hash)
+    if job is None:
+        raise KeyError(f"Unknown VOD '{video_hash}'")
+
+    return job["url"]
+
+
+def _ensure_vod_chat_processed(video_hash: str, url: str) -> dict | None:
+    """
+    Return the job the VOD data are waiting for, a download job is queued when the data are missing.
+    """
+    job_queue = get_job_queue()
+
+    job = job_queue.find_active(video_hash)
+    if job is not None:
+        return job
+
+    if any(not task.complete() for task in _build_vod_chat_tasks(url)):
+        return job_queue.enqueue(DOWNLOAD_JOB, video_hash, url)
+
+    return None
+
+
+def _build_vod_chat_tasks(url: str) -> list[luigi.Task]:
+    return [
+        CollectVodChatTimestamps(url=url),
+        CollectVodChatEmoticons(url=url),
+    ]
+
+
+def _build_luigi_tasks(tasks: list[luigi.Task]) -> bool:
+    # The plain result of `luigi.build()` tells whether the tasks were scheduled, even if some of them failed then.
+    result = luigi.build(tasks, workers=1, detailed_summary=True)
+
+    return result.status in (LuigiStatusCode.SUCCESS, LuigiStatusCode.SUCCESS_WITH_RETRY)
+
+
+def _run_download_stage(url: str) -> bool:
+    download_task = DownloadVodChat(url=url)
+
+    # The processing stage is queued into the CPU pool only for a successfully downloaded chat.
+    return _build_luigi_tasks([download_task]) and download_task.complete()
+
+
+def _run_update_stage(url: str) -> bool:
+    download_task = DownloadVodChat(url=url)
+    download_task.move_output_for_update()
+
+    # The previous outputs are kept to resume the processing from the last checkpoint.
+    ProcessVodChat(url=url).move_output_for_update()
+
+    get_figure_cache().invalidate(url_to_hash(url))
+
+    return _build_luigi_tasks([download_task]) and download_task.complete()
+
+
+def _run_processing_stage(url: str) -> bool:
+    return _build_luigi_tasks(_build_vod_chat_tasks(url))
+
+
+def _describe_job(job: dict) -> dict:
+    result = {
+        "id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "error": job["error"],
+        "status_url": url_for(".job_status", job_id=job["id"]),
+    }
+
+    if job["status"] in ACTIVE_JOB_STATUSES:
+        result["progress"] = read_json_file(hash_to_progress_file(job["video_hash"]))
+
+    return result
+
+
+def _jobs_response(jobs: list[dict]):
+    payload = json_dumps({'success': True, 'jobs': [_describe_job(job) for job in jobs]})
+
+    return current_app.response_class(payload, status=202, mimetype="application/json")
+
+
 def _is_dark_theme_request():
     return request.args.get("theme", "light") == "dark"
+
+
+def _vod_data_fingerprints(video_hash: str) -> list:
+    files = [
+        hash_to_meta_file(video_hash),
+        hash_to_timestamps_file(video_hash),
+        hash_to_emoticons_file(video_hash),
+        hash_to_histograms_file(video_hash),
+    ]
+
+    return [file_fingerprint(file) for file in files]
+
+
+def _format_sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json_dumps(data).decode('utf-8')}\n\n"
+
+
+def _json_response(payload: bytes):
+    return current_app.response_class(payload, mimetype="application/json")
+
+
+get_job_queue().register(DOWNLOAD_JOB, [(NETWORK_POOL, _run_download_stage), (CPU_POOL, _run_processing_stage)])
+get_job_queue().register(UPDATE_JOB, [(NETWORK_POOL, _run_update_stage), (CPU_POOL, _run_processing_stage)])
@@ -1,3 +1,4 @@
+import multiprocessing
 import os
 
 import webview
@@ -90,6 +91,9 @@ def close_window():
 
 
 if __name__ == "__main__":
+    # The bundled executable is started again for every worker process parsing a huge chat
+    multiprocessing.freeze_support()
+
     env_file_path = os.path.abspath(os.path.join(os.getcwd(), ".env"))
     load_dotenv(dotenv_path=env_file_path)
 
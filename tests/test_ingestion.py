@@ -0,0 +1,178 @@
+import json
+import os
+import random
+
+import numpy as np
+import pytest
+
+from flask_app.services import ingestion
+from flask_app.services.columnar import read_columns
+from flask_app.services.ingestion import ChatStatsCollector, collect_shard, split_into_shards
+from flask_app.services.lib import (
+    EMOTICONS_HISTOGRAM_PREFIX,
+    MESSAGES_HISTOGRAM_COLUMN,
+    TIMESTAMPS_COLUMN,
+    hash_to_chat_file,
+    url_to_hash,
+)
+from flask_app.tasks.vod_chat import ProcessVodChat
+
+START = 1_700_000_000  # In seconds
+CUSTOM_EMOTICONS = {"custom1", "custom2"}
+
+
+def make_message(seconds: float, text: str = "hi Kappa custom1") -> dict:
+    return {
+        "timestamp": int((START + seconds) * 1_000_000),
+        "time_in_seconds": seconds,
+        "message": text,
+        "emotes": [{"id": "25", "name": "Kappa"}] if "Kappa" in text else [],
+    }
+
+
+def generate_chat(seed: int, seconds: int, start_second: int = 0) -> list[dict]:
+    rnd = random.Random(seed)
+    texts = ["hi", "Kappa", "custom1 Kappa", "custom2", "custom1 custom1 custom2", "é custom3"]
+
+    messages = []
+    for second in range(start_second, start_second + seconds):
+        # Bursts of messages sharing the same second, and silent seconds between them
+        for _ in range(rnd.choice([0, 0, 1, 2, 5, 40])):
+            messages.append(make_message(second + rnd.random() * .99, rnd.choice(texts)))
+
+    return messages
+
+
+def write_chat(file_path, messages: list[dict], mode: str = "w") -> None:
+    with open(file_path, mode, encoding="utf-8") as fp:
+        fp.writelines(json.dumps(message) + "\n" for message in messages)
+
+
+def write_outputs(collector: ChatStatsCollector, tmp_path) -> dict:
+    outputs = {}
+    for name, writer in [
+        ("timestamps", collector.write_timestamps),
+        ("emoticons", collector.write_emoticons),
+        ("histograms", collector.write_histograms),
+    ]:
+        with open(tmp_path / f"{name}.bin", "wb") as fp:
+            writer(fp)
+
+        outputs[name] = read_columns(str(tmp_path / f"{name}.bin"))
+
+    return outputs
+
+
+def to_comparable(outputs: dict) -> dict:
+    # The revision is unique for every run, the rest of the outputs must be the same
+    return {
+        name: (
+            {column: values.tolist() for column, values in data.columns.items()},
+            {key: value for key, value in data.meta.items() if key != "revision"},
+        )
+        for name, data in outputs.items()
+    }
+
+
+def parse_sequentially(chat_file_path: str, custom_emoticons: set[str], tmp_path) -> dict:
+    collector = ChatStatsCollector(custom_emoticons)
+    with open(chat_file_path, "rb") as fp:
+        collector.add_lines(fp)
+
+    os.makedirs(tmp_path / "sequential", exist_ok=True)
+
+    return to_comparable(write_outputs(collector, tmp_path / "sequential"))
+
+
+@pytest.mark.parametrize("seconds", [-3600.5, -1, -0.999, -0.4, -0.000001])
+def test_negative_time_messages_are_skipped(seconds, tmp_path):
+    collector = ChatStatsCollector(CUSTOM_EMOTICONS)
+    collector.add_message(make_message(seconds))
+    collector.add_message(make_message(0))
+    collector.add_message(make_message(0.4))
+
+    outputs = write_outputs(collector, tmp_path)
+
+    expected = [make_message(0)["timestamp"], make_message(0.4)["timestamp"]]
+    assert outputs["timestamps"][TIMESTAMPS_COLUMN].tolist() == expected
+    assert {e: t.tolist() for e, t in outputs["emoticons"].columns.items()} == {"Kappa": expected, "custom1": expected}
+
+    histograms = outputs["histograms"]
+    assert histograms.meta["starts"][MESSAGES_HISTOGRAM_COLUMN] == START
+    assert histograms[MESSAGES_HISTOGRAM_COLUMN].tolist() == [2]
+    assert histograms[EMOTICONS_HISTOGRAM_PREFIX + "Kappa"].tolist() == [2]
+
+
+def test_negative_time_messages_are_skipped_by_recount(tmp_path):
+    chat_file = tmp_path / "chat.jsonl"
+    chat_file.write_text("".join(json.dumps(make_message(s, "custom2")) + "\n" for s in [-1.5, -0.4, 0, 2.5]))
+
+    collector = ChatStatsCollector(CUSTOM_EMOTICONS)
+    collector.recount_emoticons(str(chat_file), {"custom2"}, chat_file.stat().st_size)
+
+    outputs = write_outputs(collector, tmp_path)
+
+    assert outputs["emoticons"]["custom2"].tolist() == [make_message(0)["timestamp"], make_message(2.5)["timestamp"]]
+    assert np.array_equal(outputs["timestamps"][TIMESTAMPS_COLUMN], np.empty(0, dtype=np.int64))
+
+
+@pytest.mark.parametrize("shards_count", [2, 3, 7, 50])
+@pytest.mark.parametrize("seed", [1, 2])
+def test_shards_same_as_sequential(shards_count, seed, tmp_path):
+    chat_file = str(tmp_path / "chat.jsonl")
+    write_chat(chat_file, generate_chat(seed, 300) + [make_message(300 + i / 1000) for i in range(200)])
+
+    boundaries = split_into_shards(chat_file, 0, shards_count, 1)
+    assert len(boundaries) == shards_count + 1
+
+    collector = ChatStatsCollector(CUSTOM_EMOTICONS)
+    for start, stop in zip(boundaries[:-1], boundaries[1:]):
+        # The same as the pool of workers does, but in the current process
+        collector.add_shard(collect_shard(chat_file, start, stop, CUSTOM_EMOTICONS))
+
+    expected = parse_sequentially(chat_file, CUSTOM_EMOTICONS, tmp_path)
+    assert to_comparable(write_outputs(collector, tmp_path)) == expected
+    assert expected["timestamps"][1]["checkpoint"] is not None
+
+
+def test_parallel_parse_same_as_sequential(tmp_path, monkeypatch):
+    chat_file = str(tmp_path / "chat.jsonl")
+    write_chat(chat_file, generate_chat(3, 600))
+
+    monkeypatch.setattr(ingestion, "MIN_SHARD_SIZE", os.path.getsize(chat_file) // 3)
+
+    collector = ChatStatsCollector(CUSTOM_EMOTICONS)
+    collector.add_chat_file(chat_file, max_workers=3)
+
+    assert to_comparable(write_outputs(collector, tmp_path)) == parse_sequentially(chat_file, CUSTOM_EMOTICONS, tmp_path)
+
+
+@pytest.mark.parametrize("custom_emoticons", [CUSTOM_EMOTICONS, {"custom2", "custom3"}, set()])
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_resume_same_as_full_parse(custom_emoticons, seed, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data")
+
+    task = ProcessVodChat("https://www.twitch.tv/videos/1")
+    chat_file = hash_to_chat_file(url_to_hash(task.url))
+
+    messages = generate_chat(seed, 200)
+    write_chat(chat_file, messages)
+
+    collector = ChatStatsCollector(CUSTOM_EMOTICONS)
+    collector.add_chat_file(chat_file)
+    task.write_outputs(collector, task.resume_targets())
+
+    # The update truncates the trailing second of the chat, then downloads it again with the newer messages
+    last_second = int(messages[-1]["time_in_seconds"])
+    with open(chat_file, "r+b") as fp:
+        fp.truncate(collector.tail_boundary["offset"])
+    write_chat(chat_file, [m for m in messages if int(m["time_in_seconds"]) == last_second], "a")
+    write_chat(chat_file, [make_message(last_second + .995)] + generate_chat(seed, 100, last_second + 1), "a")
+
+    collector = ChatStatsCollector(custom_emoticons)
+    resume_offset = task.resume_collector(collector, chat_file)
+    collector.add_chat_file(chat_file, resume_offset)
+
+    assert resume_offset > 0
+    assert to_comparable(write_outputs(collector, tmp_path)) == parse_sequentially(chat_file, custom_emoticons, tmp_path)
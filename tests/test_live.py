@@ -0,0 +1,133 @@
+import json
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from flask_app.services import live
+from flask_app.services.lib import MESSAGES_SERIES, SPIKES_SERIES, aggregate_messages_series
+from flask_app.services.live import LiveChatAggregator, LiveChatSession, replay_chat_file
+from flask_app.services.utils import SecondsHistogram, normalize_counts
+
+TIME_STEP = 15
+WINDOWS = ["15s", "60s", "300s"]
+START = 1_700_000_000  # In seconds
+
+
+def write_chat(file_path, seconds: list[float]) -> None:
+    with open(file_path, "w", encoding="utf-8") as fp:
+        for s in seconds:
+            message = {"timestamp": int((START + s) * 1_000_000), "time_in_seconds": s, "message": "hi"}
+            fp.write(json.dumps(message, sort_keys=True) + "\n")
+
+
+@pytest.fixture
+def chat_file(tmp_path):
+    rng = np.random.default_rng(1)
+
+    # A steady chat with bursts and a few minutes long pause
+    seconds = rng.uniform(0, 3600, 4000)
+    seconds = np.concatenate([seconds, rng.uniform(1200, 1230, 300), rng.uniform(2000, 2010, 120)])
+    seconds = np.sort(seconds[(seconds < 2500) | (seconds > 2800)])
+
+    file_path = tmp_path / "chat.jsonl"
+    write_chat(file_path, seconds.tolist())
+
+    return str(file_path)
+
+
+def test_replay_matches_batch_series(chat_file):
+    aggregator = LiveChatAggregator(TIME_STEP, WINDOWS, history_size=10_000)
+
+    points = []
+    for message in replay_chat_file(chat_file, speed=1e9):
+        points += aggregator.add_message(message)
+
+    with open(chat_file, "rb") as fp:
+        timestamps = np.array([json.loads(line)["timestamp"] for line in fp], dtype=np.int64)
+
+    axis, counts = normalize_counts(SecondsHistogram.from_timestamps(timestamps), TIME_STEP)
+    series = aggregate_messages_series(counts, TIME_STEP, WINDOWS)
+
+    # The last bin is still open
+    assert len(points) == axis.length - 1
+    assert [p["t"] for p in points] == (axis.start + axis.offsets[:-1]).tolist()
+    assert [p[MESSAGES_SERIES] for p in points] == counts[:-1].tolist()
+    for window in WINDOWS:
+        assert [p[window] for p in points] == series[window][:-1].tolist()
+    assert [p[SPIKES_SERIES] for p in points] == series[SPIKES_SERIES][:-1].tolist()
+    assert aggregator.history == points
+
+
+def test_replay_stops_during_a_pause(tmp_path):
+    chat_file = tmp_path / "chat.jsonl"
+    write_chat(chat_file, [0, 1, 3600])
+
+    stop = threading.Event()
+    messages = replay_chat_file(str(chat_file), stop=stop)
+
+    next(messages)
+    next(messages)
+    threading.Timer(.1, stop.set).start()
+
+    started_at = time.monotonic()
+    assert list(messages) == []
+    assert time.monotonic() - started_at < 5
+
+
+def test_idle_session_stops_without_messages(tmp_path, monkeypatch):
+    monkeypatch.setattr(live, "IDLE_TIMEOUT", .2)
+
+    # A silent chat: the replay sleeps for an hour before the last message
+    chat_file = tmp_path / "chat.jsonl"
+    write_chat(chat_file, [0, 1, 3600])
+
+    session = LiveChatSession(
+        lambda stop: replay_chat_file(str(chat_file), stop=stop),
+        LiveChatAggregator(TIME_STEP, WINDOWS, history_size=100),
+    )
+    session.start()
+
+    subscriber, _ = session.subscribe()
+    time.sleep(.4)
+    assert not session.finished
+
+    session.unsubscribe(subscriber)
+    session._thread.join(timeout=5)
+
+    assert session.finished
+    assert not session._thread.is_alive()
+
+
+def test_replay_events_stream(chat_file, tmp_path, monkeypatch):
+    from flask_app import init_app
+    from flask_app.services.lib import url_to_hash
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+
+    url = "https://www.twitch.tv/videos/1"
+    video_hash = url_to_hash(url)
+    (tmp_path / "data" / f"{video_hash}_meta.json").write_text(json.dumps({"url": url}))
+    (tmp_path / "data" / f"{video_hash}_chat.jsonl").write_bytes(open(chat_file, "rb").read())
+
+    response = init_app().test_client().get(f"/vod-chat/live_events/{video_hash}?replay=1000000000")
+    assert response.mimetype == "text/event-stream"
+
+    events = [block.split("\n") for block in response.get_data(as_text=True).strip().split("\n\n")]
+    names = [lines[0].removeprefix("event: ") for lines in events if lines[0].startswith("event: ")]
+
+    assert names[0] == "snapshot"
+    assert names[-1] == "end"
+
+    points = json.loads(events[0][1].removeprefix("data: "))
+    points += [json.loads(lines[1].removeprefix("data: ")) for lines in events[1:] if lines[0] == "event: point"]
+    assert points[0]["t"] == START // TIME_STEP * TIME_STEP
+    assert sum(p[MESSAGES_SERIES] for p in points) > 0
+
+
+@pytest.mark.parametrize("window", ["-60s", "0s"])
+def test_non_positive_live_window(window):
+    with pytest.raises(ValueError):
+        LiveChatAggregator(5, [window], 10)
@@ -0,0 +1,179 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from flask_app.services.lib import SPIKES_MIN_MESSAGES, SPIKES_MIN_POWER, calc_spikes
+from flask_app.services.utils import SecondsHistogram, normalize_counts, rolling_sums
+
+START = datetime(2024, 3, 9, 23, 58, 41, tzinfo=timezone.utc)
+START_MICROSECONDS = int(START.timestamp()) * 1_000_000
+TIME_STEPS = [1, 5, 7, 15, 60, 300, 3600]
+
+
+def baseline_timeline(data: list[int], time_step: int, forced_start_timestamp: datetime | None) -> pd.DataFrame:
+    # The DataFrame path of the timelines before they were counted directly, kept as the reference
+    df = pd.DataFrame(data, columns=["timestamp"])
+
+    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True, unit="us")
+    df["messages"] = 1
+
+    df.set_index("timestamp", inplace=True)
+
+    if forced_start_timestamp is not None and forced_start_timestamp not in df.index:
+        df.loc[forced_start_timestamp] = 0
+
+    df.sort_index(inplace=True)
+
+    return df.resample(f"{time_step}s").sum()
+
+
+def baseline_spikes(df: pd.DataFrame, min_messages: int | None, min_spike_power: float | None) -> pd.DataFrame:
+    # The DataFrame spikes detection before it was vectorized, kept as the reference
+    result = df.copy()
+    first_timestamp = result.index[0]
+
+    result["delta"] = result["messages"] - result["messages"].shift()
+    result.loc[first_timestamp, "delta"] = result.loc[first_timestamp, "messages"]
+
+    result.loc[result["delta"] < 0, "delta"] = 0
+
+    if min_messages is not None:
+        mask = result["messages"] < min_messages
+        result.loc[mask, "delta"] = 0
+
+    if min_spike_power is not None:
+        mask = result["delta"] / result["messages"] < min_spike_power
+        result.loc[mask, "delta"] = 0
+
+    result["messages"] = result["delta"].astype(int)
+    result.drop(columns=["delta"], inplace=True)
+
+    return result
+
+
+def generate_timestamps(seed: int, count: int, span_seconds: int) -> list[int]:
+    rng = np.random.default_rng(seed)
+
+    timestamps = START_MICROSECONDS + rng.integers(0, span_seconds * 1_000_000, count)
+    # Bursts of messages sent within the same microsecond
+    timestamps = np.concatenate([timestamps, np.repeat(timestamps[:count // 10], 3)])
+
+    return sorted(timestamps.tolist())
+
+
+def assert_same_timeline(data: list[int], time_step: int, forced_start_timestamp: datetime | None = None):
+    expected = baseline_timeline(data, time_step, forced_start_timestamp)
+
+    histogram = SecondsHistogram.from_timestamps(np.array(data, dtype=np.int64))
+    axis, bins = normalize_counts(histogram, time_step, forced_start_timestamp)
+
+    assert axis.length == len(expected)
+    assert np.array_equal(bins, expected["messages"].to_numpy())
+    if len(expected):
+        assert axis.start_timestamp == expected.index[0]
+        assert np.array_equal(axis.offsets, (expected.index - expected.index[0]).total_seconds().astype(np.int64))
+
+
+@pytest.mark.parametrize("time_step", TIME_STEPS)
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_random_timestamps(time_step, seed):
+    assert_same_timeline(generate_timestamps(seed, 2000, 4 * 3600), time_step)
+
+
+@pytest.mark.parametrize("time_step", TIME_STEPS)
+def test_duplicate_timestamps(time_step):
+    timestamp = START_MICROSECONDS
+
+    assert_same_timeline([timestamp] * 5 + [timestamp + 1] * 3 + [timestamp + 90_000_000] * 2, time_step)
+
+
+@pytest.mark.parametrize("time_step", TIME_STEPS)
+@pytest.mark.parametrize("forced_offset", [
+    timedelta(hours=-3, microseconds=250),
+    timedelta(seconds=-1),
+    timedelta(0),
+    timedelta(minutes=30, microseconds=999_999),
+    timedelta(hours=5),
+])
+def test_forced_start_timestamp(time_step, forced_offset):
+    assert_same_timeline(generate_timestamps(4, 500, 3600), time_step, START + forced_offset)
+
+
+@pytest.mark.parametrize("time_step", TIME_STEPS)
+def test_single_timestamp(time_step):
+    assert_same_timeline([START_MICROSECONDS], time_step)
+
+
+def test_empty_timestamps():
+    assert_same_timeline([], 5)
+
+
+@pytest.mark.parametrize("time_step", TIME_STEPS)
+def test_empty_timestamps_with_forced_start(time_step):
+    assert_same_timeline([], time_step, START)
+
+
+def generate_gapped_timestamps(seed: int) -> list[int]:
+    # Dense bursts separated by silent gaps longer than the widest window
+    bursts = [generate_timestamps(seed + i, 300, 120) for i in range(3)]
+
+    return sorted(t + i * 2 * 3600 * 1_000_000 for i, burst in enumerate(bursts) for t in burst)
+
+
+def assert_same_series(data: list[int], time_step: int, windows: list[str]):
+    expected = baseline_timeline(data, time_step, None)
+
+    histogram = SecondsHistogram.from_timestamps(np.array(data, dtype=np.int64))
+    _, bins = normalize_counts(histogram, time_step)
+
+    sums = rolling_sums(bins, time_step, windows)
+    for i, window in enumerate(windows):
+        assert np.array_equal(sums[i], expected.rolling(window).sum().astype(int)["messages"].to_numpy()), window
+
+    for min_messages, min_spike_power in [(None, None), (SPIKES_MIN_MESSAGES, SPIKES_MIN_POWER), (1, 1.)]:
+        spikes = calc_spikes(bins, min_messages=min_messages, min_spike_power=min_spike_power)
+        if len(expected):
+            expected_spikes = baseline_spikes(expected, min_messages, min_spike_power)["messages"].to_numpy()
+        else:
+            expected_spikes = np.empty(0, dtype=np.int64)
+
+        assert np.array_equal(spikes, expected_spikes), (min_messages, min_spike_power)
+
+
+ROLLING_WINDOWS = ["1s", "7s", "15s", "60s", "5min", "1h", "30h"]
+
+
+@pytest.mark.parametrize("time_step", TIME_STEPS)
+@pytest.mark.parametrize("seed", [1, 2])
+def test_random_series(time_step, seed):
+    assert_same_series(generate_timestamps(seed, 2000, 4 * 3600), time_step, ROLLING_WINDOWS)
+
+
+@pytest.mark.parametrize("time_step", TIME_STEPS)
+def test_gapped_series(time_step):
+    assert_same_series(generate_gapped_timestamps(5), time_step, ROLLING_WINDOWS)
+
+
+@pytest.mark.parametrize("time_step", TIME_STEPS)
+def test_window_edge_series(time_step):
+    # The windows of exactly one, a bit less and a bit more than whole numbers of bins
+    windows = [f"{time_step}s", f"{time_step * 3}s", f"{time_step * 3 - 1}s", f"{time_step * 3 + 1}s"]
+
+    assert_same_series(generate_timestamps(6, 500, 1800), time_step, windows)
+
+
+@pytest.mark.parametrize("time_step", TIME_STEPS)
+def test_single_timestamp_series(time_step):
+    assert_same_series([START_MICROSECONDS], time_step, ROLLING_WINDOWS)
+
+
+def test_empty_series():
+    assert_same_series([], 5, ROLLING_WINDOWS)
+
+
+@pytest.mark.parametrize("window", ["-60s", "0s", "500ms", -60, 0])
+def test_non_positive_rolling_window(window):
+    with pytest.raises(ValueError):
+        rolling_sums(np.ones(10, dtype=np.int64), 5, [window])
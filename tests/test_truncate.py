@@ -0,0 +1,103 @@
+import json
+import os
+import random
+import shutil
+
+import pytest
+
+from flask_app.services.lib import truncate_last_second_messages
+
+
+def baseline_truncate_last_second_messages(chat_file_path) -> int | None:
+    # The line by line backwards scan before the chunked one, kept as the reference
+    with open(chat_file_path, "ab+") as fp:
+        def seek_line_back(count: int = 1) -> int:
+            while count > 0:
+                fp.seek(-2, os.SEEK_CUR)
+                while fp.read(1) != b'\n':
+                    pos = fp.seek(-2, os.SEEK_CUR)
+                    if pos == 0:
+                        return pos
+
+                count -= 1
+
+            return fp.tell()
+
+        def read_current_line_json_attr(attr: str):
+            line = fp.readline()
+            line_json = json.loads(line)
+            return line_json[attr]
+
+        try:  # catch OSError in case of a one line file
+            seek_line_back(1)
+        except OSError:
+            return None
+
+        last_line_seconds = int(read_current_line_json_attr("time_in_seconds"))
+
+        while True:
+            pos = seek_line_back(2)
+            line_seconds = int(read_current_line_json_attr("time_in_seconds"))
+
+            if line_seconds != last_line_seconds:
+                fp.truncate(fp.tell())
+                return last_line_seconds
+
+            if pos == 0:
+                fp.truncate(0)
+                return last_line_seconds
+
+
+def write_chat(file_path, seconds: list[int], rnd: random.Random) -> list[bytes]:
+    lines = []
+    for second in seconds:
+        # A few messages longer than the 64 KiB chunks of the backwards reading
+        length = rnd.randint(70_000, 100_000) if rnd.random() < .01 else rnd.randint(0, 50)
+        message = {"time_in_seconds": second + rnd.random() * .9, "message": "x" * length}
+        lines.append((json.dumps(message) + "\n").encode("utf-8"))
+
+    with open(file_path, "wb") as fp:
+        fp.writelines(lines)
+
+    return lines
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_same_as_baseline(seed, tmp_path):
+    rnd = random.Random(seed)
+
+    for i in range(30):
+        seconds = sorted(rnd.randint(0, 8) for _ in range(rnd.randint(1, 60)))
+        write_chat(tmp_path / "expected.jsonl", seconds, rnd)
+        shutil.copy(tmp_path / "expected.jsonl", tmp_path / "actual.jsonl")
+
+        expected = baseline_truncate_last_second_messages(tmp_path / "expected.jsonl")
+        actual = truncate_last_second_messages(tmp_path / "actual.jsonl")
+
+        assert actual == expected
+        assert (tmp_path / "actual.jsonl").read_bytes() == (tmp_path / "expected.jsonl").read_bytes()
+
+
+def test_empty_file(tmp_path):
+    (tmp_path / "chat.jsonl").touch()
+
+    assert truncate_last_second_messages(tmp_path / "chat.jsonl") is None
+    assert (tmp_path / "chat.jsonl").stat().st_size == 0
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_partial_last_line(seed, tmp_path):
+    rnd = random.Random(seed)
+    seconds = sorted(rnd.randint(0, 8) for _ in range(rnd.randint(2, 60)))
+
+    write_chat(tmp_path / "expected.jsonl", seconds, rnd)
+    shutil.copy(tmp_path / "expected.jsonl", tmp_path / "actual.jsonl")
+    # An interrupted write leaves a line without its end
+    with open(tmp_path / "actual.jsonl", "ab") as fp:
+        fp.write(b'{"time_in_seconds": 9.5, "mess')
+
+    expected = baseline_truncate_last_second_messages(tmp_path / "expected.jsonl")
+    actual = truncate_last_second_messages(tmp_path / "actual.jsonl")
+
+    assert actual == expected
+    assert (tmp_path / "actual.jsonl").read_bytes() == (tmp_path / "expected.jsonl").read_bytes()
@@ -1,6 +1,6 @@
 from flask import g
 
-from app_context.appmenu import compose_menu
+from app_context.appmenu import get_app_menu
 from flask_app import init_app
 
 app = init_app()
@@ -8,10 +8,7 @@ app = init_app()
 
 @app.before_request
 def init_app_menu():
-    menu = compose_menu()
-
-    # TODO Cache the value
-    g.main_menu = menu
+    g.main_menu = get_app_menu()
 
 
 if __name__ == '__main__':